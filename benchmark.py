@@ -0,0 +1,289 @@
+'''
+Benchmarks for the chemistry functions in project.py
+usage:
+    python benchmark.py                              time everything and print results
+    python benchmark.py --output results.json        also save results (machine readable)
+    python benchmark.py --compare baseline.json      flag anything slower than a saved run (exit code 1 if so),
+                                                     everything is run again (up to 3 times) to check slowdowns
+    python benchmark.py --sympy                      check built in balancer against the old sympy method
+Run from the folder with the csv files (project.db is created/updated there like when running the bot)
+'''
+# standard library
+import argparse
+import asyncio
+import importlib.util
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+
+import engine
+import project
+
+# a slowdown has to show up this many times in a row to count, noise from other programs rarely slows the same thing
+# every time (each attempt runs everything again, and the fastest time of each benchmark is kept)
+COMPARE_ATTEMPTS = 3
+
+# equations students actually send, from small to large
+EQUATIONS = [
+    "H2 + O2 = H2O",
+    "CH4 + O2 = CO2 + H2O",
+    "C3H8 + O2 = CO2 + H2O",
+    "C6H12O6 + O2 = CO2 + H2O",
+    "C8H18 + O2 = CO2 + H2O",
+    "C12H22O11 + O2 = CO2 + H2O",
+    "NO3 + Co = Co(NO3)2",
+    "Fe + O2 = Fe2O3",
+    "Al + O2 = Al2O3",
+    "Na + Cl2 = NaCl",
+    "N2 + H2 = NH3",
+    "KClO3 = KCl + O2",
+    "CaCO3 = CaO + CO2",
+    "Zn + HCl = ZnCl2 + H2",
+    "AgNO3 + NaCl = AgCl + NaNO3",
+    "Pb(NO3)2 + KI = PbI2 + KNO3",
+    "Ca3(PO4)2 + SiO2 + C = CaSiO3 + P4 + CO",
+    "Al + H2SO4 = Al2(SO4)3 + H2",
+    "Fe2O3 + CO = Fe + CO2",
+    "Cu + HNO3 = Cu(NO3)2 + NO + H2O",
+    "KMnO4 + HCl = KCl + MnCl2 + H2O + Cl2",
+    "K4[Fe(CN)6] + H2SO4 + H2O = K2SO4 + FeSO4 + (NH4)2SO4 + CO",
+    "CuSO4.5H2O = CuSO4 + H2O",
+    "C2H5OH + O2 = CO2 + H2O",
+    "NH4NO3 = N2O + H2O",
+    "Mg(OH)2 + HCl = MgCl2 + H2O",
+    "C57H110O6 + O2 = CO2 + H2O",
+    "K2Cr2O7 + HCl = KCl + CrCl3 + H2O + Cl2",
+    "Na2CO3 + HCl = NaCl + H2O + CO2",
+    "Ca(OH)2 + H3PO4 = Ca3(PO4)2 + H2O",
+    "FeS2 + O2 = Fe2O3 + SO2",
+    "NaHCO3 = Na2CO3 + H2O + CO2",
+    "Al + Fe2O3 = Al2O3 + Fe",
+    "P4 + O2 = P4O10",
+    "H2O2 = H2O + O2",
+    "SiCl4 + H2O = H4SiO4 + HCl",
+    "Fe + H2O = Fe3O4 + H2",
+    "C6H5COOH + O2 = CO2 + H2O",
+    "Ba(OH)2 + H2SO4 = BaSO4 + H2O",
+    "NH3 + O2 = NO + H2O",
+    "HNO3 + Cu = Cu(NO3)2 + NO2 + H2O",
+    "Fe(OH)3 = Fe2O3 + H2O",
+    "KNO3 + C = K2CO3 + CO + N2",
+    "Na3PO4 + MgCl2 = NaCl + Mg3(PO4)2",
+    "C2H2 + O2 = CO2 + H2O",
+    "H2O = H2O2",  # not balanceable, still timed
+]
+
+# formulas with brackets and hydrates (molar mass and parser)
+FORMULAS = [
+    "H2O", "CO2", "O2", "C6H12O6", "C12H22O11", "Co(NO3)2", "Ca3(PO4)2", "Al2(SO4)3", "(NH4)2Cr2O7",
+    "((CH3)3C)2O", "K4[Fe(CN)6]", "Fe4[Fe(CN)6]3", "[Co(NH3)6]Cl3", "Mg3(Si2O5)2(OH)2", "CuSO4.5H2O",
+    "CuSO4·5H2O", "Na2B4O7·10H2O", "MgSO4·7H2O", "(CH3)2CHCH2CH(CH3)2", "Ca10(PO4)6(OH)2",
+    "K2[PtCl6]", "[Cu(NH3)4]SO4·H2O", "C57H110O6", "Pb(C2H5)4", "Ba(ClO4)2", "Fe2(C2O4)3",
+]
+
+
+def organic_combustion():  # combustion of alkanes, alkenes and alcohols with up to 100 carbons
+    equations = []
+    for n in range(1, 101):
+        equations.append(f"C{n}H{2 * n + 2} + O2 = CO2 + H2O")
+    for n in range(2, 61):
+        equations.append(f"C{n}H{2 * n} + O2 = CO2 + H2O")
+    for n in range(1, 61):
+        equations.append(f"C{n}H{2 * n + 1}OH + O2 = CO2 + H2O")
+    return equations
+
+
+def ion_pairs():  # every (cation, anion) pair from the elements and ions tables (first charge only)
+    return list(project.IonicTable)
+
+
+def corpus():
+    pairs = ion_pairs()
+    equations = EQUATIONS + organic_combustion()
+    # formulas of every ionic compound plus the ones with brackets
+    formulas = FORMULAS + [project.convert_subscript(i, False) for i in
+                           (project.balance_ionic(*pair) for pair in pairs) if i]
+    return {'equations': equations, 'formulas': formulas, 'pairs': pairs}
+
+
+def time_per_item(function, items, repeat=10):
+    # runs function over every item, as many times as timeit needs for each run to take at least 0.2s
+    # returns best/median microseconds per item over repeat runs
+    def run_all():
+        for item in items:
+            function(item)
+
+    timer = timeit.Timer(run_all)
+    number = timer.autorange()[0]
+    runs = [seconds / number / len(items) * 1e6 for seconds in timer.repeat(repeat, number)]
+    return {'best_us': min(runs), 'median_us': statistics.median(runs), 'items': len(items)}
+
+
+def wait_for_writes():  # so database writes queued by the benchmark before aren't running while the next one is timed
+    project.Data.submit_write(lambda: None).result()
+
+
+def uncached_balance(equation):  # balance without balanced equation cache or parser cache
+    project.parse_formula.cache_clear()
+    reactants, products = project.split_equation(equation)
+    return project.format_equation(reactants, products, project.solve_equation(reactants, products))
+
+
+def stoich_end_to_end(equations, repeat=10):  # +stoich load then +stoich calculate through the command engine
+    caller = engine.Caller(None, 0, 0, '@benchmark', True)
+
+    async def run():
+        runs = []
+        for i in range(repeat + 1):  # first run starts the worker processes, so it isn't counted
+            start = time.perf_counter()
+            for equation in equations:
+                await engine.execute('stoichiometry', ['load', *equation.split()], caller)
+                await engine.execute('stoichiometry', ['calculate', '1', 'grams', '10', '2', 'grams'], caller)
+            runs.append((time.perf_counter() - start) / len(equations) * 1e6)
+        return runs[1:]
+
+    runs = asyncio.run(run())
+    project.Workers.shutdown()
+    return {'best_us': min(runs), 'median_us': statistics.median(runs), 'items': len(equations)}
+
+
+def run_benchmarks():
+    project.prepare_database()
+    data = corpus()
+    equations, formulas, pairs = data['equations'], data['formulas'], data['pairs']
+
+    results = {}
+    results['balance_uncached'] = time_per_item(uncached_balance, equations)
+    for equation in equations:  # fill cache, then time cache hits
+        project.balance(equation)
+    wait_for_writes()  # every equation balanced above is saved to database
+    results['balance_cached'] = time_per_item(project.balance, equations)
+
+    def uncached_molar_mass(formula):
+        project.parse_formula.cache_clear()
+        return project.molar_mass(formula)
+    results['molar_mass_uncached'] = time_per_item(uncached_molar_mass, formulas)
+    results['molar_mass_cached'] = time_per_item(project.molar_mass, formulas[:project.FORMULA_CACHE_SIZE])
+    results['balance_ionic'] = time_per_item(lambda pair: project.balance_ionic(*pair), pairs)
+    results['ionic_table_build'] = time_per_item(lambda i: project.load_ionic_table(), [None], repeat=3)
+    results['test_soluble'] = time_per_item(lambda pair: project.test_soluble(*pair), pairs)
+    results['stoich_end_to_end'] = stoich_end_to_end(EQUATIONS[:20] * 25)  # long enough runs to time reliably
+    project.Data.close()
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'corpus': {key: len(value) for key, value in data.items()},
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold, show=True):
+    # returns names of benchmarks slower than baseline by more than threshold
+    regressions = []
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        old = baseline['results'][name]['best_us']
+        change = (result['best_us'] - old) / old if old else 0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  <-- REGRESSION'
+        if show:
+            print(f"{name:22} {old:10.2f} -> {result['best_us']:10.2f} µs ({change:+.1%}){flag}")
+    return regressions
+
+
+def keep_fastest(results, new):  # best time of each benchmark from two runs of everything
+    for name, result in new['results'].items():
+        if result['best_us'] < results['results'][name]['best_us']:
+            results['results'][name] = result
+
+
+def equation_matrix(equation):
+    reactants, products = project.split_equation(equation)
+    return project.composition_matrix(reactants, products)
+
+
+def sympy_coefficients(matrix):  # old balancing method, kept only to check and time the new one
+    from sympy import Matrix, lcm
+    answer = Matrix(matrix).nullspace()[0]
+    multiple = lcm([i.q for i in answer])
+    return [int(i) for i in answer * multiple]
+
+
+def compare_with_sympy():
+    if importlib.util.find_spec('sympy') is None:
+        print("sympy is not installed, skipping comparison")
+        return
+    equations = EQUATIONS + organic_combustion()
+    matrices = []
+    mismatches = 0
+    for equation in equations:
+        matrix = equation_matrix(equation)
+        try:
+            expected = sympy_coefficients(matrix)
+            if any(i <= 0 for i in expected):  # old method didn't check for impossible answers
+                expected = None
+        except IndexError:
+            expected = None
+        result = project.solve_coefficients(matrix)
+        matrices.append(matrix)
+        if result != expected:
+            mismatches += 1
+            print(f"Mismatch for {equation}: {result} (sympy: {expected})")
+    print(f"{len(equations) - mismatches}/{len(equations)} equations match sympy")
+
+    for name, solver in (("built in", project.solve_coefficients), ("sympy", sympy_coefficients)):
+        def solve_all():
+            for matrix in matrices:
+                try:
+                    solver(matrix)
+                except IndexError:
+                    pass
+        seconds = min(timeit.repeat(solve_all, number=3, repeat=3))
+        print(f"{name}: {seconds / (3 * len(matrices)) * 1e6:.1f} µs per equation")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chemistry functions")
+    parser.add_argument('--output', metavar='PATH', help="save results as json")
+    parser.add_argument('--compare', metavar='PATH', help="compare against results saved with --output")
+    parser.add_argument('--threshold', type=float, default=0.10, help="slowdown counted as regression (0.10 = 10%%)")
+    parser.add_argument('--sympy', action='store_true', help="check balancer against sympy instead")
+    arguments = parser.parse_args()
+
+    if arguments.sympy:
+        compare_with_sympy()
+        return
+
+    results = run_benchmarks()
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            baseline = json.load(file)
+        for attempt in range(1, COMPARE_ATTEMPTS):
+            if not compare(results, baseline, arguments.threshold, show=False):
+                break
+            print(f"Slower than baseline, running again to check (attempt {attempt + 1} of {COMPARE_ATTEMPTS})")
+            keep_fastest(results, run_benchmarks())
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if arguments.compare:
+        regressions = compare(results, baseline, arguments.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        print(f"corpus: {results['corpus']}")
+        for name, result in results['results'].items():
+            print(f"{name:22} {result['best_us']:10.2f} µs (median {result['median_us']:.2f}, {result['items']} items)")
+
+
+if __name__ == "__main__":
+    main()
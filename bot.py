@@ -0,0 +1,200 @@
+'''
+Discord side of the chemistry bot, commands are run by engine.py and their replies are sent back here
+usage: python bot.py  (or python project.py)
+'''
+# standard library
+import argparse
+import asyncio
+import io
+import os
+import time
+import weakref
+
+StartupTimes = {'start': time.perf_counter()}  # seconds spent in each part of startup (imports, data, gateway)
+
+# required dependency | py -m pip install discord.py  (for windows)
+import discord
+from discord.ext import commands
+
+import engine
+import metrics
+import project
+from engine import Caller, aliases
+from profiling import Profiles
+from project import Data, Workers
+
+StartupTimes['imports'] = time.perf_counter() - StartupTimes['start']
+
+MAX_ATTACHMENT_SIZE = 64 * 1024  # bytes read from each .txt/.csv attachment
+# set by shards.py when running as one of several processes
+SHARD_IDS = [int(i) for i in os.environ.get('CHEMBOT_SHARD_IDS', '').split(',') if i]
+SHARD_COUNT = int(os.environ.get('CHEMBOT_SHARD_COUNT', 0))
+SHARED_DATA = os.environ.get('CHEMBOT_SHARED_DATA')  # element and ion tables saved by shards.py
+SYNC_INTERVAL = 5  # seconds between checking for ions added by other processes
+# engine embeds converted for discord, so embeds shared by cached replies (elements, ions, help) are converted once
+DiscordEmbeds = weakref.WeakKeyDictionary()
+
+if SHARD_IDS:
+    Bot = commands.AutoShardedBot(command_prefix=engine.PREFIX, help_command=None,
+                                  shard_ids=SHARD_IDS, shard_count=SHARD_COUNT)
+else:
+    Bot = commands.Bot(command_prefix=engine.PREFIX, help_command=None)
+# change bot command prefix to '+' and create custom help command
+
+
+# coroutines (I already know the flowchart is going to be a mess)
+
+
+@Bot.event
+async def on_ready():  # when bot connects
+    await Bot.change_presence(
+        activity=discord.Activity(type=discord.ActivityType.listening, name='your every command | +help')
+    )
+    print(f"{Bot.user} is online")
+    if 'ready' not in StartupTimes:  # on_ready also runs after reconnecting
+        StartupTimes['ready'] = time.perf_counter() - StartupTimes['start']
+        StartupTimes['gateway'] = time.perf_counter() - StartupTimes['connect']
+        print(startup_report())
+        metrics.serve(loop=asyncio.get_running_loop())
+        if SHARD_IDS:
+            asyncio.ensure_future(sync_shared_data())
+
+
+async def sync_shared_data():  # other processes share the database, so ions they add or delete are checked for
+    while True:
+        await asyncio.sleep(SYNC_INTERVAL)
+        try:
+            await engine.sync_shared_data()
+        except Exception as error:  # keep checking
+            print(f"Could not check for ion changes: {error!r}")
+
+
+@Bot.event
+async def on_disconnect():  # when bot disconnects
+    print(f"{Bot.user} has disconnected")
+
+
+@Bot.event
+async def on_command_error(ctx, error):  # when error (invalid command) is raised
+    name = ctx.command.name if ctx.command is not None else 'unknown'
+    metrics.Metrics.count('command_errors_total', command=name, error=type(error).__name__)
+    await ctx.send(f"```Error: {str(error)} | type +help for list of commands```")
+
+# inputs/outputs  (commands)
+
+
+def discord_embed(embed):  # engine embeds aren't changed after they are sent, so each is converted once
+    converted = DiscordEmbeds.get(embed)
+    if converted is None:
+        converted = DiscordEmbeds[embed] = discord.Embed.from_dict(embed.to_dict())
+    return converted
+
+
+class Chemistry(commands.Cog):
+    # every command just passes the words after it to the engine, and sends back the replies
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def run(self, ctx, name, args):
+        caller = Caller(ctx.guild.id if ctx.guild is not None else None, ctx.channel.id, ctx.author.id,
+                        ctx.author.mention, await self.bot.is_owner(ctx.author))
+        replies = await engine.execute(name, list(args), caller)
+        start = time.perf_counter()
+        for reply in replies:
+            embed = discord_embed(reply.embed) if reply.embed is not None else None
+            file = discord.File(io.BytesIO(reply.file[1]), filename=reply.file[0]) if reply.file is not None else None
+            message = await ctx.send(reply.text, embed=embed, file=file)
+            if reply.reaction is not None:
+                await message.add_reaction(reply.reaction)
+        metrics.Metrics.observe('command_phase_seconds', time.perf_counter() - start, command=name, phase='send')
+
+    async def read_attachments(self, ctx):  # text of each .txt or .csv file attached to the command message
+        texts = []
+        for attachment in ctx.message.attachments:
+            if attachment.filename.lower().endswith(('.txt', '.csv')) and attachment.size <= MAX_ATTACHMENT_SIZE:
+                texts.append((await attachment.read()).decode('utf-8-sig', errors='replace'))
+        return texts
+
+    @commands.command(name='help', aliases=aliases('help'))  # custom help command
+    async def help_message(self, ctx, *args):
+        await self.run(ctx, 'help', args)
+
+    @commands.command(name='hello', aliases=aliases('hello'))
+    async def hello(self, ctx, *args):
+        await self.run(ctx, 'hello', args)
+
+    @commands.command(name='database', aliases=aliases('database'))
+    async def database(self, ctx, *args):
+        await self.run(ctx, 'database', args + tuple(await self.read_attachments(ctx)))  # files for import
+
+    @commands.command(name='conversion', aliases=aliases('conversion'))
+    async def convert_unit(self, ctx, *args):
+        await self.run(ctx, 'conversion', args)
+
+    @commands.command(name='ionic', aliases=aliases('ionic'))
+    async def soluble(self, ctx, *args):
+        await self.run(ctx, 'ionic', args)
+
+    @commands.command(name='calculate', aliases=aliases('calculate'))
+    async def calculate(self, ctx, *args):
+        await self.run(ctx, 'calculate', args + tuple(await self.read_attachments(ctx)))  # files for composition
+
+    @commands.command(name='stoichiometry', aliases=aliases('stoichiometry'))
+    async def stoich_commands(self, ctx, *args):
+        await self.run(ctx, 'stoichiometry', args)
+
+    @commands.command(name='balance', aliases=aliases('balance'))
+    async def balance_equation(self, ctx, *args):
+        # uses the message itself instead of args so line breaks (one equation per line) are kept
+        text = ctx.message.content[len(ctx.prefix) + len(ctx.invoked_with):]
+        text = '\n'.join([text, *await self.read_attachments(ctx)])
+        await self.run(ctx, 'balance', text.strip().split(' '))
+
+    @commands.command(name='cache', aliases=aliases('cache'))
+    async def cache_commands(self, ctx, *args):
+        await self.run(ctx, 'cache', args)
+
+    @commands.command(name='stats', aliases=aliases('stats'))
+    async def stats(self, ctx, *args):
+        await self.run(ctx, 'stats', args)
+
+    @commands.command(name='profile', aliases=aliases('profile'))
+    async def profile_commands(self, ctx, *args):
+        await self.run(ctx, 'profile', args)
+
+
+Bot.add_cog(Chemistry(Bot))
+
+
+def startup_report():
+    return (f"Startup took {StartupTimes['ready']:.2f}s: imports {StartupTimes['imports']:.2f}s, "
+            f"data load {StartupTimes['data']:.2f}s, gateway connect {StartupTimes['gateway']:.2f}s")
+
+
+def main():
+    TOKEN = ''  # replace string with string of your bot token
+    # Create your own bot from discord developer portal; im sure you'll figure out how
+    parser = argparse.ArgumentParser(description="Discord chemistry bot")
+    parser.add_argument('--snapshot', metavar='PATH', help="save prebuilt database to PATH and exit")
+    arguments = parser.parse_args()
+    if arguments.snapshot:
+        project.export_snapshot(arguments.snapshot)  # closes the database
+        return
+
+    start = time.perf_counter()
+    project.ShareIonChanges = bool(SHARD_IDS)  # other processes check ion_changes for ions added here
+    if not (SHARED_DATA and project.map_shared_data(SHARED_DATA)):
+        project.prepare_database()  # create tables (or rebuild them if csv files changed)
+    engine.warm_lookup_caches()
+    StartupTimes['data'] = time.perf_counter() - start
+    StartupTimes['connect'] = time.perf_counter()
+    Bot.run(TOKEN)
+    # starts main event loop
+    # script will create discord session to the bot matching the token
+    Workers.shutdown()
+    Data.close()  # finish saving anything still queued
+    Profiles.dump()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+'''
+Run bot commands locally without discord (for testing, or replaying saved commands to measure throughput)
+usage: python cli.py [file ...]   (commands are read from stdin if no file is given)
+Each line is one command as it would be typed in discord, i.e. +balance CH4 + O2 = CO2 + H2O
+'''
+# standard library
+import argparse
+import asyncio
+import shlex
+import sys
+import time
+
+import engine
+import project
+from engine import Caller
+from profiling import Profiles
+
+
+def split_command(line):  # split into words like discord does (quotes keep words together)
+    try:
+        return shlex.split(line)
+    except ValueError:  # unclosed quote
+        return line.split()
+
+
+def render(reply):  # reply as plain text
+    lines = []
+    if reply.text is not None:
+        lines.append(reply.text.replace('```', '').strip('\n'))
+    if reply.embed is not None:
+        embed = reply.embed
+        if embed.title:
+            lines.append(f"[{embed.title}]")
+        if embed.description:
+            lines.append(embed.description.replace('```', '').strip('\n'))
+        for field in embed.fields:
+            lines.append(f"{field['name']}:\n{field['value'].replace('```', '').strip()}")
+    if reply.file is not None:
+        lines.append(f"[{reply.file[0]}]\n{reply.file[1].decode('utf-8')}")
+    if reply.reaction is not None:
+        lines.append(f"(reacted {reply.reaction})")
+    return '\n'.join(lines)
+
+
+async def run_lines(lines, caller, concurrency=1):  # returns list of (line, replies) in same order as lines
+    limit = asyncio.Semaphore(concurrency)
+
+    async def run_line(line):
+        words = split_command(line)
+        name = words[0][len(engine.PREFIX):] if words[0].startswith(engine.PREFIX) else words[0]
+        async with limit:
+            return line, await engine.execute(name, words[1:], caller)
+
+    commands = [line.strip() for line in lines]
+    commands = [line for line in commands if line and not line.startswith('#')]  # skip blank lines and comments
+    return await asyncio.gather(*(run_line(line) for line in commands))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run chemistry bot commands without discord")
+    parser.add_argument('files', nargs='*', help="files with one command per line (default: stdin)")
+    parser.add_argument('--concurrency', type=int, default=1, help="commands run at the same time")
+    parser.add_argument('--quiet', action='store_true', help="only print the timing summary")
+    arguments = parser.parse_args()
+
+    lines = []
+    if arguments.files:
+        for path in arguments.files:
+            with open(path, encoding='utf-8') as file:
+                lines.extend(file.readlines())
+    else:
+        lines = sys.stdin.readlines()
+
+    project.prepare_database()
+    engine.warm_lookup_caches()
+    caller = Caller(None, 0, 0, '@cli', True)  # acts like the bot owner in direct messages
+    start = time.perf_counter()
+    results = asyncio.run(run_lines(lines, caller, arguments.concurrency))
+    elapsed = time.perf_counter() - start
+    project.Workers.shutdown()
+    project.Data.close()
+    for path in Profiles.dump():  # only if CHEMBOT_PROFILE was set or +profile was used
+        print(f"Saved profile to {path}", file=sys.stderr)
+
+    if not arguments.quiet:
+        for line, replies in results:
+            print(f"> {line}")
+            for reply in replies:
+                print(render(reply))
+            print()
+    rate = len(results) / elapsed if elapsed else 0
+    print(f"{len(results)} commands in {elapsed:.3f}s ({rate:.1f} commands/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1149 @@
+'''
+Command engine: every bot command as a plain coroutine that returns its replies instead of sending them,
+so commands can run without discord (bot.py sends the replies to discord, cli.py prints them)
+'''
+# standard library
+import csv
+import inspect
+import math
+import time
+from collections import Counter, namedtuple, OrderedDict
+
+from metrics import PHASES, Metrics, Phases, Timer
+from profiling import Profiles
+
+from project import (Data, EquationCache, Jobs, Sessions, InputTooLarge, JobTimeout, QueueFull, UnderdeterminedEquation,
+                     MAX_BATCH_EQUATIONS, MAX_BATCH_FORMULAS, UNIT_TABLE, add_ion, balance_all_in_worker,
+                     balance_in_worker, coefficients_in_worker, convert_subscript, convert_unit as convert,
+                     create_session, delete_ion, element_list, find_element, find_ion, find_ionic_compound,
+                     find_unit, gas_constant, gas_law_table, ion_list, ionic_table, molar_mass, molar_mass_in_worker,
+                     parse_formula, session_key, stoich_table, sync_ion_changes, test_soluble)
+
+PREFIX = '+'
+MESSAGE_LENGTH = 1900  # discord allows 2000 characters per message, the rest is left for markdown
+BATCH_MESSAGES = 3  # batch results longer than this many messages are sent as a file instead
+MAX_VALUES = 1000  # numbers a list or range of values (i.e. 0..100 step 5) can have
+MAX_IMPORT_IONS = 500  # ions one +data import can add
+ELEMENT_CACHE_SIZE = 256  # +database lookups kept ready to send (every element fits)
+ION_CACHE_SIZE = 512  # users can add ions, so not all of them are kept
+SEARCH_RESULTS = 5  # +database matches listed when the search isn't exact
+FUZZY_MATCH = 0.3  # fraction of trigrams a misspelled search has to share with a name
+
+Reply = namedtuple('Reply', ['text', 'embed', 'reaction', 'file'])  # one message, text uses discord markdown
+# file is (filename, bytes) or None
+Caller = namedtuple('Caller', ['guild', 'channel', 'user', 'mention', 'admin'])  # who sent the command
+# guild is None in direct messages, admin is True for the bot owner
+
+Command = namedtuple('Command', ['function', 'aliases', 'admin', 'parameters', 'required', 'rest'])
+COMMANDS = {}  # command name -> Command
+ALIASES = {}  # alias (and name) -> command name
+
+
+class CommandError(Exception):  # error message shown to user (same as discord.py's errors)
+    pass
+
+
+class Embed:
+    # same layout as a discord embed, without needing discord (bot.py converts it with discord.Embed.from_dict)
+    def __init__(self, title=None, description=None, color=None):
+        self.title = title
+        self.description = description
+        self.color = color
+        self.fields = []
+
+    def add_field(self, name, value, inline=True):
+        self.fields.append({'name': name, 'value': value, 'inline': inline})
+        return self
+
+    def to_dict(self):
+        embed = {'type': 'rich', 'fields': [dict(field) for field in self.fields]}
+        for key in ('title', 'description', 'color'):
+            if getattr(self, key) is not None:
+                embed[key] = getattr(self, key)
+        return embed
+
+
+class Replies(list):  # replies from one command, in order
+    def send(self, text=None, embed=None, reaction=None, file=None):
+        self.append(Reply(text, embed, reaction, file))
+
+
+def command(name, aliases=(), admin=False):  # registers coroutine as a command
+    def register(function):
+        parameters = list(inspect.signature(function).parameters.values())[2:]  # skip reply and caller
+        rest = any(i.kind == i.VAR_POSITIONAL for i in parameters)
+        parameters = [i for i in parameters if i.kind == i.POSITIONAL_OR_KEYWORD]
+        required = [i.name for i in parameters if i.default is i.empty]
+        COMMANDS[name] = Command(function, tuple(aliases), admin, len(parameters), required, rest)
+        for alias in (name, *aliases):
+            ALIASES[alias] = name
+        return function
+    return register
+
+
+def aliases(name):
+    return list(COMMANDS[name].aliases)
+
+
+async def execute(name, args, caller):
+    # run command (name can be an alias) with list of words typed after it, returns the replies
+    replies = Replies()
+    label = ALIASES.get(name, 'unknown')  # name used in metrics
+    # seconds spent in each part of the command, database time is added by Data.read and Data.write, and time spent
+    # reading equations and numbers inside the command is added to parse with Timer('parse')
+    phases = {}
+    token = Phases.set(phases)
+    start = time.perf_counter()
+    called = None
+    try:
+        if name not in ALIASES:
+            raise CommandError(f'Command "{name}" is not found')
+        command = COMMANDS[ALIASES[name]]
+        if command.admin and not caller.admin:
+            raise CommandError("You do not own this bot.")
+        if len(args) < len(command.required):
+            raise CommandError(f"{command.required[len(args)]} is a required argument that is missing.")
+        if not command.rest:
+            args = args[:command.parameters]  # extra words are ignored
+        called = time.perf_counter()
+        profile = Profiles.start(label) if Profiles.rates else None  # nothing else happens when profiling is off
+        try:
+            await command.function(replies, caller, *args)
+        finally:
+            if profile is not None:
+                Profiles.stop(label, profile)
+    except Exception as error:  # when error (invalid command) is raised
+        Metrics.count('command_errors_total', command=label, error=type(error).__name__)
+        replies.send(f"```Error: {str(error)} | type +help for list of commands```")
+    finally:
+        Phases.reset(token)
+    end = time.perf_counter()
+    parsing = phases.get('parse', 0)
+    phases['parse'] = (called or end) - start + parsing  # checking arguments, then parsing inside the command
+    if called is not None:
+        phases['compute'] = end - called - phases.get('db', 0) - parsing
+    Metrics.count('commands_total', command=label)
+    Metrics.observe('command_latency_seconds', end - start, command=label)
+    for phase, seconds in phases.items():
+        Metrics.observe('command_phase_seconds', seconds, command=label, phase=phase)
+    return replies
+
+
+# commands (replies are sent in the order they are added)
+
+GAS_LAW_OUTPUT = {'p': 'Pressure', 'v': 'Volume', 'n': 'Moles', 't': 'Temperature'}
+
+
+def gas_law_words(words):
+    # words for each gas law value, either 4 values in order (p v n t) or name=value where a value can be followed
+    # by more words (i.e. t=273..373 step 5), names p1..t2 are the combined gas law (n1, n2 are 1 if not given)
+    # missing values are None, raises IndexError or ValueError if words can't be read
+    if not any('=' in word for word in words):
+        return {name: [words[i]] for i, name in enumerate('pvnt')}
+    given = {}
+    name = None
+    for word in words:
+        if '=' in word:
+            name, word = word.lower().split('=', 1)
+            given[name] = []
+        if name is None:  # words before the first name=value
+            raise ValueError
+        if word:
+            given[name].append(word)
+    combined = any(name[-1:] in ('1', '2') for name in given)
+    names = [i + state for state in '12' for i in 'pvnt'] if combined else list('pvnt')
+    if set(given) - set(names) or not all(given.values()):
+        raise ValueError
+    if combined and 'n1' not in given and 'n2' not in given:  # amount of gas usually doesn't change
+        given['n1'] = given['n2'] = ['1']
+    return {name: given.get(name) for name in names}
+
+
+def gas_law_value(words):  # values from parse_values, or None if not given or not a number (i.e. 'find')
+    if words is None:
+        return None
+    try:
+        with Timer('parse'):
+            return parse_values(words)
+    except InputTooLarge:
+        raise
+    except ValueError:
+        return None
+
+
+def decimal_places(text):  # decimal places typed in a number (whole numbers count as 1)
+    return len(text.split('.')[1]) if '.' in text else 1
+
+
+def parse_values(words):
+    # numbers and ranges ('0..100', optionally followed by 'step 5') to list of (value, decimal places)
+    # raises ValueError if a word isn't a number or range, or InputTooLarge if there are too many values
+    values = []
+    words = list(words)
+    while words:
+        word = words.pop(0)
+        step_text = '1'
+        if len(words) >= 2 and words[0].lower() == 'step':
+            step_text = words[1]
+            words = words[2:]
+        if '..' in word:
+            start_text, end_text = word.split('..', 1)
+            start, end, step = float(start_text), float(end_text), abs(float(step_text))
+            if not step:
+                raise ValueError("step can't be 0")
+            count = int(abs(end - start) / step + 1e-9) + 1
+            if len(values) + count > MAX_VALUES:
+                raise InputTooLarge(f"Too many values (limit is {MAX_VALUES}).")
+            places = max(decimal_places(start_text), decimal_places(step_text))
+            step = step if end >= start else -step
+            values.extend((round(start + i * step, places), places) for i in range(count))
+        else:
+            values.append((float(word), decimal_places(word)))
+            if len(values) > MAX_VALUES:
+                raise InputTooLarge(f"Too many values (limit is {MAX_VALUES}).")
+    return values
+
+
+def round_value(value, places):  # rounds for display, small values (i.e. eV in J) use scientific notation
+    if value and abs(value) < 0.1 ** places:
+        return f"{value:.4g}"
+    return round(value, places)
+
+
+@command(name='help', aliases=['h', 'commands'])  # custom help command
+async def help_message(reply, caller):  # commands are always passed reply and caller, reply.send('Message') adds a reply
+    embed = Embed(title="CSE2910 Chemistry Bot",
+                          description='''Bot that helps with chemistry and whilst taking up my processor power and RAM.                    
+\nCredit to Mohammad-Ali Bandzar for equation balancing code:
+\n(Bandzar, M.-A. (2020, May 27). Balancing Chemical Equations With Python. Medium. https://medium.com/swlh/balancing-chemical-equations-with-python-837518c9075b.)''',
+                          color=5935975)
+    embed.add_field(name="Element/Ion Database",
+                    value='''```
++database (Element / Ion) (name, symbol or formula, or the start of one): Gets element/ion data
++database add (ion name) (ion formula) (charge)
++database import (attach csv file of name, formula, charge)
++database delete (ion name, * to reset databases)```''',
+                    inline=False)
+    embed.add_field(name="Balance Equation | +balance help",
+                    value='''```+balance (equation): \nBalances equations```''',
+                    inline=False)
+    embed.add_field(name="Unit Conversion | +convert help",
+                    value='```+convert (values) (conversion): \nConverts one unit to another```',
+                    inline=False)
+    embed.add_field(name="Ionic Compound Formation",
+                    value='```+ionic (pos ion) (neg ion): \nBalances and determines solubility (most common charge)\n+ionic table (ion): \nEvery compound (with ion if given)```',
+                    inline=False)
+    embed.add_field(name="Calculations | +calculate help for more info",
+                    value='''```
++calculate gas (p) (v) (n) (t)
++calculate moles (formula)
++calculate composition (formulas)```''',
+                    inline=False)
+    embed.add_field(name="Stoichiometry | +stoich help for more info",
+                    value='''```
++stoich load (equation)
++stoich show
++stoich calculate (id) (unit) (value) (id2) (unit2)
++stoich table (id) (unit) (value) ...```''',
+                    inline=False)
+    reply.send(embed=embed)
+
+
+@command(name='hello')  # say hello back
+async def hello(reply, caller):
+    reply.send(f"Hello! {caller.mention}", reaction='\N{THUMBS UP SIGN}')
+
+
+@command(name='database', aliases=['data', 'dat', 'd'])  # reading, writing, deleting from database
+# aliases are just alternate names for command (+database and +data will run the same command)
+async def database(reply, caller, subcmd='', arg1=None, arg2=None, arg3=None, *rest):  # takes context, subcommand, and 3 arguements
+    # variables are given default values of 'None' so that error messages can be displayed
+    # subcmd, arg1-3 are all arguments (the first 4 words user types after command), and have default values
+    # rest is only used by import (attached file is added after the words)
+    if subcmd.lower() == 'import':  # adding every ion in attached file
+        await import_ions(reply, [i for i in (arg1, arg2, arg3, *rest) if i is not None])
+    elif subcmd.lower().startswith("e"):  # search periodic table for element
+        await lookup(reply, 'elements', arg1, "```Could not find element data.```")
+    elif subcmd.lower().startswith('i'):  # search for ion
+        await lookup(reply, 'ions', arg1, "```Could not find ion in database.```")
+
+    elif subcmd.lower().startswith('a') or subcmd.lower().startswith('w') :  # adding ion (writing ion)
+        if arg3 is not None:
+            success = await Data.wait(add_ion(arg1, arg2, arg3))  # success is the outcome of write command
+            await refresh_ion(arg2)
+            if success == 'Success':
+                reply.send(f"```Successfully added {arg1} to database```")
+            elif success == 'Duplicate':
+                embed = await IonEmbeds.get(arg2)
+                reply.send("```Entry already exists within database; delete the entry first to modify it. | +data delete (formula)```")
+                reply.send(embed=embed)  # output ion data that is duplicated
+            elif success == 'Invalid charge':
+                reply.send(f"```Invalid given charge: '{arg3}' (i.e. 1- or 2+)```")
+            else:
+                reply.send(f"```Invalid given formula: '{arg2}'```")
+        else:  # not enough arguments
+            reply.send('''```
+Invalid command format: use +data write (name) (formula) (ionic charge)
+Example: +data add Acetate CH3COO 1-```''')
+
+    elif subcmd.lower().startswith('d'):  # deleting ion
+        name = arg1
+        deleted = await Data.wait(delete_ion(name))  # delete any ions matching the first given argument
+        if arg1 != '*':
+            await refresh_ion(name)
+            if deleted:
+                reply.send(f"```Successfully deleted {arg1} from database```")
+            else:
+                reply.send(f"```Could not find ion '{arg1}' in database (delete uses the formula)```")
+        else:  # everything was reloaded
+            await reload_lookups()
+            reply.send(f"```Successfully reloaded database```")
+    else:
+        reply.send("```Invalid command format | +help for list of commands```")
+
+
+def read_ion_rows(texts):
+    # (name, formula, charge) from csv text like polyatomic_ions.csv (header and molar mass column are optional)
+    # returns rows, and numbers of lines that couldn't be read
+    rows, invalid = [], []
+    for number, row in enumerate(csv.reader('\n'.join(texts).splitlines()), 1):
+        row = [i.strip() for i in row]
+        if not any(row) or row[0].lower() == 'name':
+            continue
+        if len(row) < 3 or not all(row[:3]):
+            invalid.append(number)
+        else:
+            rows.append(tuple(row[:3]))
+    return rows, invalid
+
+
+async def import_ions(reply, texts):  # +data import, everything is saved in one transaction
+    rows, invalid = read_ion_rows(texts)
+    if not rows:
+        reply.send('''```
+Invalid command format: attach a .csv or .txt file with one ion on each line (name, formula, charge)
+Example line: Acetate,CH3COO,1-```''')
+        return
+    if len(rows) > MAX_IMPORT_IONS:
+        reply.send(f"```Too many ions (limit is {MAX_IMPORT_IONS} for each import)```")
+        return
+    futures = [add_ion(*row) for row in rows]  # queued together, so they are saved together
+    results = [await Data.wait(future) for future in futures]
+    problems = {'Duplicate': "already in database", 'Invalid charge': "invalid charge", False: "invalid formula"}
+    lines = [f"Line {number}: needs name, formula and charge" for number in invalid]
+    for (name, formula, charge), result in zip(rows, results):
+        if result == 'Success':
+            await refresh_ion(formula)
+        else:
+            lines.append(f"{name} ({formula}, {charge}): {problems[result]}")
+    summary = f"Added {results.count('Success')} of {len(rows) + len(invalid)} ions"
+    send_lines(reply, [summary, *lines], 'import.txt', summary)
+
+
+@command(name='conversion', aliases=["convert", 'con'])
+async def convert_unit(reply, caller, *args):  # values then conversion, i.e. 1 2 0..100 step 10 c-k
+    if not args or args[0].lower().startswith("help"):  # list of conversions
+        units = {}
+        for symbol, dimension, size, offset, names in UNIT_TABLE:
+            units.setdefault(dimension.capitalize(), []).append(names[0])
+        units = '\n'.join(f"> {dimension}: {', '.join(names)}" for dimension, names in units.items())
+        reply.send(f'''```
+Command Format:
++conversion (values) (unit)-(new unit)
++conversion (values) (unit) to (new unit)```
+```
+Values can be numbers, or ranges with a step (i.e. 0..100 step 10)
+Units can be divided (i.e. kj/mol-j/mol)
+
+Supported Units:
+{units}```''')
+        return
+    if len(args) >= 4 and args[-2].lower() == 'to':
+        conversion = f"{args[-3]}-{args[-1]}"
+        args = args[:-3]
+    else:
+        conversion = args[-1]
+        args = args[:-1]
+    try:
+        with Timer('parse'):
+            values = parse_values(args)
+        if not values:
+            raise ValueError
+    except InputTooLarge as error:
+        reply.send(f"```{error}```")
+        return
+    except ValueError:
+        reply.send("```Conversion value must be a number. | +convert help```")
+        return
+
+    result = convert([value for value, places in values], conversion)
+    if result is None:
+        reply.send(f"```Could not find requested conversion | +convert help to show list of conversions```")
+        return
+    unit, converted, new_unit = result
+    lines = [f"{value}{unit} = {round_value(new_value, places)}{new_unit}"
+             for (value, places), new_value in zip(values, converted)]
+    send_lines(reply, lines, 'conversions.txt', f"Converted {len(lines)} values")
+
+
+@command(name='ionic', aliases=["soluble", 'sol', 'ion', 'i'])
+async def soluble(reply, caller, pos_ion, neg_ion=None):
+    if pos_ion.lower() == 'table':  # every pair (or every pair with one ion)
+        rows = ionic_table(neg_ion)
+        if not rows:
+            reply.send(f"```Could not find ion '{neg_ion}' in database.```")
+            return
+        lines = ['cation,anion,formula,soluble,molar mass']
+        for (cation, anion), compound in rows:
+            mass = round(compound.mass, 2) if compound.mass is not None else 'N/A'
+            lines.append(f"{cation},{anion},{compound.formula},{'yes' if compound.soluble else 'no'},{mass}")
+        send_lines(reply, lines, 'ionic_table.csv', f"{len(rows)} ionic compounds")
+        return
+    if neg_ion is None:
+        raise CommandError("neg_ion is a required argument that is missing.")
+
+    compound = find_ionic_compound(pos_ion, neg_ion)  # worked out when the database was loaded
+    if compound is not None:
+        if compound.soluble:
+            reply.send(f"```The ions {pos_ion} and {neg_ion} will form {compound.formula}, which is soluble in water```")
+        else:
+            reply.send(f"```The ions {pos_ion} and {neg_ion} will form {compound.formula}, which is not soluble in water```")
+    else:
+        if test_soluble(pos_ion, neg_ion):
+            reply.send(f"```{pos_ion} and {neg_ion} will form a water soluble compound, but one or more ionic charges were not found in database.```")
+        else:
+            reply.send(f"```{pos_ion} and {neg_ion} will not form a water soluble compound, but one or more ionic charges were not found in database.```")
+
+
+@command(name='calculate', aliases=["cal", 'calc'])
+async def calculate(reply, caller, subcmd='', *args):  # *args returns a tuple of all arguments in command message after the first 2
+    if subcmd.lower().startswith('h'):  # help command
+        embed = Embed(title="Calculations", color=6073213)
+        embed.add_field(name="Gas Law | +calculate gas (p) (v) (n) (t)",
+                        value='''```
+p: pressure in kPa
+v: volume of gas in L
+n: moles of gas
+t: temperature in K
+Replace a parameter with a word (i.e 'find') to calculate for value. (Any other non numeric value will also work)
+Example: +calculate gas 120 2.0 1.0 find
+
+Values can also be named and given as ranges to get a table:
++calculate gas p=101.325 n=1 t=273..373 step 5 v=find
+Combined gas law (n1 and n2 can be left out):
++calculate gas p1=100 v1=2 t1=300 p2=find v2=3 t2=350
+Other units (and R) with units=(pressure),(volume):
++calculate gas 1 22.4 1 find units=atm,l```''',
+                        inline=False)
+
+        embed.add_field(name="Molar Mass | +calculate moles (formula)",
+                        value='''```
+formula: Ionic compound formula (case-sensitive)```''',
+                        inline=False)
+        embed.add_field(name="Percent Composition | +calculate composition (formulas)",
+                        value=f'''```
+formulas: up to {MAX_BATCH_FORMULAS} formulas, 'ions' for every ion in the database,
+or attach a .txt/.csv file with one formula per line (first column)
+Example: +calculate composition H2O CO2 C6H12O6```''',
+                        inline=False)
+        reply.send(embed=embed)
+
+    elif subcmd.lower().startswith('g'):  # gas calculation
+        # PV = nRT, one value is a word (i.e. 'find') and any of the others can be ranges (i.e. t=273..373 step 5)
+        words = [word for word in args if not word.lower().startswith('units=')]
+        units = [word[6:].split(',') for word in args if word.lower().startswith('units=')]
+        pressure, volume = (units[-1] + ['l'])[:2] if units else ('kpa', 'l')
+        r = gas_constant(pressure, volume)
+        if r is None:
+            reply.send("```Unknown pressure or volume unit | +calculate help```")
+            return
+        try:
+            with Timer('parse'):
+                given = gas_law_words(words)
+        except IndexError:
+            reply.send("```Incorrect number of parameters given | +calculate help```")
+            return
+        except ValueError:
+            reply.send("```Invalid command format | +calculate help```")
+            return
+        try:
+            values = {name: gas_law_value(value) for name, value in given.items()}
+        except InputTooLarge as error:
+            reply.send(f"```{error}```")
+            return
+        unknown = [name for name, value in values.items() if value is None]
+        if not unknown:  # user inputted all values of gas law (so theres nothing to calculate for)
+            reply.send("```Can't calculate if all the values are already provided```")
+            return
+        if len(unknown) > 1:
+            reply.send("```Invalid command format | +calculate help```")
+            return
+        if math.prod(len(value) for value in values.values() if value is not None) > MAX_VALUES:
+            reply.send(f"```Too many values (limit is {MAX_VALUES}).```")
+            return
+
+        values = {name: value and [number for number, places in value] for name, value in values.items()}
+        rows = gas_law_table(values, r)
+        symbols = {'p': find_unit(pressure).symbol, 'v': find_unit(volume).symbol, 'n': ' mol', 't': 'K'}
+        name = unknown[0]
+        if len(rows) == 1:
+            value = rows[0][name]
+            label = GAS_LAW_OUTPUT[name[0]] + {'1': ' (initial)', '2': ' (final)'}.get(name[1:], '')
+            if value is None:
+                reply.send("```Can't divide by zero | +calculate help```")
+            else:
+                reply.send(f"```{label}: {round(value, 5)}{symbols[name[0]]}```")
+        else:  # table of every combination, as csv
+            names = list(values)
+            lines = [','.join(f"{i} ({symbols[i[0]].strip()})" for i in names)]
+            for row in rows:
+                lines.append(','.join(str(round(row[i], 5)) if row[i] is not None else 'N/A' for i in names))
+            send_lines(reply, lines, 'gas_law.csv', f"Calculated {len(rows)} values")
+
+    elif subcmd.lower().startswith('m'):  # molar mass calculation (takes only the first argument)
+        try:
+            result = molar_mass(args[0])
+        except IndexError:
+            reply.send("```Invalid command format | +calculate help```")
+            return
+        if not result:  # could not read formula
+            reply.send(f"```Invalid formula given: {args[0]} (Formulas are case-sensitive)```")
+        else:
+            formula = convert_subscript(args[0])
+            reply.send(f"```Molar mass of {formula}: {round(result, 2)} g/mol```")
+
+    elif subcmd.lower().startswith('c'):  # molar mass and percent composition of many formulas
+        formulas = []
+        for arg in args:  # attached files are passed as one argument, with one formula per line (csv: first column)
+            for line in arg.splitlines():
+                formula = line.split(',')[0].strip()
+                if formula.lower() == 'ions':  # everything in the ions table
+                    formulas.extend(ion.formula for ion in ion_list())
+                elif formula and formula.lower() != 'formula':  # skip blank lines and csv header
+                    formulas.append(formula)
+        if not formulas:
+            reply.send("```Invalid command format | +calculate help```")
+            return
+        skipped = len(formulas) - MAX_BATCH_FORMULAS
+        formulas = formulas[:MAX_BATCH_FORMULAS]
+        try:
+            results = await molar_mass_in_worker(formulas, caller.guild)
+        except QueueFull as error:
+            reply.send(f"```{error}```")
+            return
+        except JobTimeout:
+            reply.send("```Calculating took too long and was cancelled, try fewer formulas.```")
+            return
+        lines = []
+        for formula, result in zip(formulas, results):
+            if result is None:
+                lines.append(f"{formula} | Invalid formula")
+            else:
+                mass, percents = result
+                percents = ', '.join(f"{element} {round(percent, 2)}%" for element, percent in percents)
+                lines.append(f"{convert_subscript(formula)} | {round(mass, 2)} g/mol | {percents}")
+        if skipped > 0:
+            lines.append(f"Only the first {MAX_BATCH_FORMULAS} formulas were calculated ({skipped} skipped).")
+        send_lines(reply, lines, 'composition.txt', f"Calculated {len(formulas)} formulas")
+
+    else:
+        reply.send("```Invalid command format | +calculate help```")
+
+
+@command(name='stoichiometry', aliases=["stoich", 'equation', 'e'])
+async def stoich_commands(reply, caller, subcmd, *args):
+    if subcmd.lower().startswith('h'):  # help
+        embed = Embed(title="Chemical Equations (Stoichiometry)", color=4905928)
+        embed.add_field(name="Load equation | +stoich load (equation)",
+                        value='''```
+equation: unbalanced equation
+i.e. +cal stoich load NO3 + Co = Co(NO3)2```''',
+                        inline=False)
+        embed.add_field(name="Load equation | +stoich show",
+                        value='''```
+Shows currently loaded equation```''',
+                        inline=False)
+        embed.add_field(name="Load equation | +stoich calculate (id) (unit) (value) (id2) (unit2)",
+                        value='''```
+Converts amount of one substance to another based on balanced equation:
+id: id number of molecule
+unit: grams or moles (default to moles)
+value: number of grams or moles
+id2: id number of molecule to calculate for
+
+Example: +stoich cal 1 grams 20.3 3 grams```''',
+                        inline=False)
+        embed.add_field(name="Limiting reagent | +stoich table (id) (unit) (value) ...",
+                        value='''```
+Finds the limiting reagent, the yield of every product and what is left of each reactant:
+id, unit, value: amount of a reactant (repeat for as many reactants as you have)
+
+Example: +stoich table 1 grams 16 2 moles 1.5```''',
+                        inline=False)
+        reply.send(embed=embed)
+
+    elif subcmd.lower().startswith("l"):  # load equation
+
+        try:
+            reactants, products, coeff = await coefficients_in_worker(''.join(args), caller.guild)  # try to balance
+        except (InputTooLarge, QueueFull) as error:
+            reply.send(f"```{error}```")
+            return
+        except JobTimeout:
+            reply.send("```Balancing took too long and was cancelled, check the equation for mistakes.```")
+            return
+        except (IndexError, ValueError):
+            reply.send("```Invalid equation formatting | +balance help for details```")
+            return
+        except UnderdeterminedEquation as error:
+            reply.send(f"```{error}```")
+            return
+        if coeff is None:
+            reply.send("```Could not find a way to balance equation.```")
+            return
+
+        session = create_session(reactants, products, coeff)  # each user has their own loaded equation
+        Sessions.set(session_key(caller), session)
+        reply.send("```Balanced equation loaded to memory.```")
+        reply.send(embed=show_equation(session))
+
+    elif subcmd.lower().startswith("s"):  # show loaded equation again
+        session = Sessions.get(session_key(caller))
+        if session is not None:
+            reply.send(embed=show_equation(session))
+        else:
+            reply.send("```Please load an equation first | +stoich load (equation)```")
+
+    elif subcmd.lower().startswith("c"):  # calculate with mole ratio
+        try:
+            index = abs(int(args[0])) - 1  # don't want to deal with negative index numbers
+            unit = args[1]
+            value = float(args[2])
+            output_index = abs(int(args[3])) - 1
+            output_unit = args[4]
+        except IndexError:
+            reply.send("```Invalid command format | +stoich help```")
+            return
+        except ValueError:
+            reply.send("```Invalid command format | +stoich help```")
+            return
+        session = Sessions.get(session_key(caller))
+        if session is None:
+            reply.send("```Please load an equation first | +stoich load (equation)```")
+            return
+        if index < len(session.formulas) and output_index < len(session.formulas):
+            ratio = session.coefficients[output_index] / session.coefficients[index]
+            # mole ratio of requested molecule to given molecule
+
+            if unit.lower().startswith('g'):  # if user inputted grams, convert to moles
+                mole_mass = session.masses[index]  # molar masses were calculated when equation was loaded
+                if mole_mass is None:
+                    reply.send(f"```Could not find molar mass of molecule '{session.formulas[index]}'```")
+                    return
+                moles = value / mole_mass
+            else:  # if given unit was moles
+                moles = value
+
+            moles = moles * ratio  # calculate moles of requested molecule, convert from moles
+            output_molecule = convert_subscript(session.formulas[output_index])
+
+            if output_unit.lower().startswith('g'):  # if user wants answer in grams
+                mole_mass = session.masses[output_index]
+                if mole_mass is None:
+                    reply.send(f"```Could not find molar mass of molecule '{output_molecule}'```")
+                    return
+                reply.send(f"```The calculated mass of {output_molecule} is {round(moles * mole_mass, 5)} grams.```")
+            else:
+                reply.send(f"```The calculated quantity of {output_molecule} is {round(moles, 5)} moles.```")
+
+    elif subcmd.lower().startswith("t"):  # limiting reagent, yields and excess for given amounts of reactants
+        session = Sessions.get(session_key(caller))
+        if session is None:
+            reply.send("```Please load an equation first | +stoich load (equation)```")
+            return
+        amounts = {}  # reactant index -> moles
+        try:
+            if not args or len(args) % 3:
+                raise ValueError
+            for i in range(0, len(args), 3):
+                index = int(args[i]) - 1  # molecules are numbered from 1
+                value = float(args[i + 2])
+                if value < 0:
+                    raise ValueError
+                if not 0 <= index < session.reactants:
+                    reply.send(f"```Molecule {index + 1} is not a reactant | +stoich show```")
+                    return
+                if args[i + 1].lower().startswith('g'):  # grams
+                    if session.masses[index] is None:
+                        reply.send(f"```Could not find molar mass of molecule '{session.formulas[index]}'```")
+                        return
+                    value = value / session.masses[index]
+                amounts[index] = value
+        except ValueError:
+            reply.send("```Invalid command format | +stoich help```")
+            return
+        reply.send(embed=show_stoich_table(session, *stoich_table(session, amounts)))
+    else:
+        reply.send("```Invalid command format | +stoich help```")
+
+
+@command(name='balance', aliases=["b", 'bal'])
+async def balance_equation(reply, caller, *arg):
+    if arg and arg[0].lower() == 'help':  # user has to type out all of help since equations can also start with h
+        embed = Embed(title="Equation Balancing", color=4905928, description='''```
++balance (unbalanced equation):
+
+i.e. +balance C6H12O6 + O2 = CO2 + H2O 
+
+> Equation is case-sensitive
+> Spaces between terms are technically optional
+> Use '=' or '->' between reactants and products
+> Brackets can be nested (i.e. K4[Fe(CN)6])
+> Hydrates use '.' or '·' (i.e. CuSO4.5H2O)
+> Several equations can be balanced at once by putting each on its own line,
+  or attaching a .txt file with one equation per line```''')
+        reply.send(embed=embed)
+        return
+
+    lines = [line.strip() for line in ' '.join(arg).splitlines()]
+    lines = [line for line in lines if line and not line.startswith('#')]
+    if len(lines) > 1:
+        await balance_batch(reply, caller, lines)
+        return
+    try:
+        output = await balance_in_worker(''.join(arg), caller.guild)  # join arguments so spaces don't change output
+    except Exception as error:
+        output = error
+    reply.send(f"```{balance_result(output)}```")
+
+
+def balance_result(output):  # message for output of balance_in_worker (or the error it raised)
+    if isinstance(output, (InputTooLarge, QueueFull, UnderdeterminedEquation)):
+        return str(output)
+    if isinstance(output, JobTimeout):
+        return "Balancing took too long and was cancelled, check the equation for mistakes."
+    if isinstance(output, (IndexError, ValueError)):  # missing '=' is an IndexError, unreadable formulas are ValueErrors
+        return "Invalid command format | +balance help"
+    if isinstance(output, Exception):
+        return f"Error: {output}"
+    if output is None:
+        return "Could not find a way to balance equation"
+    return f"Balanced equation: {''.join(output)}"
+
+
+async def balance_batch(reply, caller, equations):  # balance one equation per line, errors are reported on their line
+    skipped = len(equations) - MAX_BATCH_EQUATIONS
+    equations = equations[:MAX_BATCH_EQUATIONS]
+    outputs = await balance_all_in_worker(equations, caller.guild)
+    lines = []
+    for number, (equation, output) in enumerate(zip(equations, outputs), 1):
+        if isinstance(output, list):
+            lines.append(f"{number}. {''.join(output)}")
+        else:
+            lines.append(f"{number}. {equation} | {balance_result(output)}")
+    if skipped > 0:
+        lines.append(f"Only the first {MAX_BATCH_EQUATIONS} equations were balanced ({skipped} skipped).")
+
+    send_lines(reply, lines, 'balanced.txt', f"Balanced {len(equations)} equations")
+
+
+def send_lines(reply, lines, filename, summary):
+    # sends lines in as few messages as possible without cutting lines, or as a file if that's too many messages
+    messages = ['']
+    for line in lines:
+        if messages[-1] and len(messages[-1]) + len(line) + 1 > MESSAGE_LENGTH:
+            messages.append('')
+        messages[-1] += line + '\n'
+    if len(messages) > BATCH_MESSAGES:
+        reply.send(f"```{summary} (results attached)```", file=(filename, '\n'.join(lines).encode('utf-8')))
+    else:
+        for message in messages:
+            reply.send(f"```{message}```")
+
+
+@command(name='cache', admin=True)  # admin command, only the bot owner can use it
+async def cache_commands(reply, caller, subcmd='show'):
+    if subcmd.lower().startswith('c'):  # clear cache
+        EquationCache.clear()
+        reply.send("```Cleared balanced equation cache```")
+    else:
+        stats = await Data.read(EquationCache.stats)
+        lookups = stats['hits'] + stats['database_hits'] + stats['misses']
+        hit_rate = (stats['hits'] + stats['database_hits']) / lookups * 100 if lookups else 0
+        reply.send(f"""```
+Balanced equation cache:
+In memory: {stats['memory']}/{EquationCache.size}
+Saved in database: {stats['saved']}
+Memory hits: {stats['hits']}
+Database hits: {stats['database_hits']}
+Misses: {stats['misses']}
+Hit rate: {round(hit_rate, 1)}%```""")
+
+
+@command(name='stats', admin=True)  # admin command, counts and latency of every command since startup
+async def stats(reply, caller):
+    with Metrics.lock:
+        counts = dict(Metrics.counters['commands_total'])
+        errors = dict(Metrics.counters['command_errors_total'])
+        latency = dict(Metrics.histograms['command_latency_seconds'])
+        phases = dict(Metrics.histograms['command_phase_seconds'])
+    lines = ["Command        Count Errors   p50 ms   p95 ms | mean ms: parse compute db send"]
+    for labels in sorted(counts, key=counts.get, reverse=True):
+        command = dict(labels)['command']
+        error_count = sum(value for key, value in errors.items() if dict(key)['command'] == command)
+        histogram = latency[labels]
+        means = []
+        for phase in PHASES:
+            phase_histogram = phases.get((('command', command), ('phase', phase)))
+            means.append(f"{phase_histogram.sum / phase_histogram.count * 1000:.2f}" if phase_histogram else '-')
+        lines.append(f"{command:14} {counts[labels]:5} {error_count:6} {histogram.quantile(0.5) * 1000:8.1f} "
+                     f"{histogram.quantile(0.95) * 1000:8.1f} | {' '.join(means)}")
+    if not counts:
+        lines.append("No commands yet")
+    lines.append('')
+    for cache, (hits, misses) in cache_lookups().items():
+        rate = hits / (hits + misses) * 100 if hits + misses else 0
+        lines.append(f"{cache.capitalize()} cache: {round(rate, 1)}% hits ({hits + misses} lookups)")
+    lines.append(f"Worker jobs: {Jobs.running} running, {sum(Jobs.waiting().values())} waiting")
+    error_types = {}
+    for labels, value in errors.items():
+        error_types[dict(labels)['error']] = error_types.get(dict(labels)['error'], 0) + value
+    if error_types:
+        lines.append("Errors: " + ', '.join(f"{error} {value}" for error, value in error_types.items()))
+    send_lines(reply, lines, 'stats.txt', "Stats")
+
+
+@command(name='profile', admin=True)  # admin command, profile some uses of commands with cProfile
+async def profile_commands(reply, caller, subcmd='show', name=None, rate='1'):
+    if subcmd.lower() == 'on':  # +profile on (command) (fraction of uses, default all)
+        if name not in ALIASES:
+            reply.send(f"```Unknown command '{name}' | +profile on (command) (rate)```")
+            return
+        Profiles.set_rate(ALIASES[name], float(rate))
+        reply.send(f"```Profiling {float(rate) * 100:g}% of {ALIASES[name]} commands```")
+    elif subcmd.lower() == 'off':  # +profile off (command), or everything if no command given
+        for command in ([ALIASES.get(name, name)] if name else list(Profiles.rates)):
+            Profiles.set_rate(command, 0)
+        reply.send("```Profiling stopped (collected stats are kept until +profile clear)```")
+    elif subcmd.lower() == 'dump':
+        paths = Profiles.dump()
+        reply.send(f"```Saved {', '.join(str(path) for path in paths)}```" if paths else "```Nothing profiled yet```")
+    elif subcmd.lower() == 'clear':
+        Profiles.clear()
+        reply.send("```Cleared profile stats```")
+    else:  # show what is being profiled and the slowest functions so far
+        lines = [f"Profiling: {', '.join(f'{command} {rate:g}' for command, rate in Profiles.rates.items()) or 'off'}"]
+        for command, samples in Profiles.samples.items():
+            lines.append(f"\n{command} ({samples} samples)")
+            lines.extend(Profiles.summary(command).strip('\n').splitlines())
+        send_lines(reply, lines, 'profile.txt', "Profile")
+
+
+# outputs  (mostly just formatting and creating embeds)
+
+def show_equation(session):   # display loaded equation
+    embed = Embed(title="Loaded Equation:",
+                          description=session.equation,
+                          color=4905928)
+    molecule_list = ''
+    for i in range(len(session.formulas)):
+        molecule_list += f"{i+1}: {session.formulas[i]}\n"
+    embed.add_field(name="Molecules",
+                    value=molecule_list,
+                    inline=False)  # displays element name
+    return embed
+
+
+def amount(moles, mass):  # moles (and grams if molar mass is known)
+    if mass is None:
+        return f"{round(moles, 5)} mol"
+    return f"{round(moles, 5)} mol ({round(moles * mass, 5)} g)"
+
+
+def show_stoich_table(session, limiting, changes, left):  # display output of stoich_table()
+    embed = Embed(title="Stoichiometry Table", description=session.equation, color=4905928)
+    embed.add_field(name="Limiting Reagent",
+                    value=f"```{limiting + 1}: {convert_subscript(session.formulas[limiting])}```",
+                    inline=False)
+    reactants = ''
+    for i in range(session.reactants):
+        formula = convert_subscript(session.formulas[i])
+        if i in left:
+            reactants += f"{i + 1}: {formula} | used {amount(changes[i], session.masses[i])}, " \
+                         f"left {amount(left[i], session.masses[i])}\n"
+        else:  # amount wasn't given, so show how much is needed
+            reactants += f"{i + 1}: {formula} | needs {amount(changes[i], session.masses[i])}\n"
+    embed.add_field(name="Reactants", value=f"```{reactants}```", inline=False)
+    products = ''
+    for i in range(session.reactants, len(session.formulas)):
+        products += f"{i + 1}: {convert_subscript(session.formulas[i])} | " \
+                    f"yield {amount(changes[i], session.masses[i])}\n"
+    embed.add_field(name="Theoretical Yield", value=f"```{products}```", inline=False)
+    return embed
+
+
+async def lookup(reply, table, search, not_found):  # send embed of best match for +database element/ion search
+    matches = Names.search(table, search) if search else []
+    if not matches:
+        reply.send(not_found)
+        return
+    key, name = matches[0]
+    if search.lower() not in (key.lower(), name.lower()):  # not exact, so say what was found and what else matched
+        others = ''.join(f"\n> {name} ({key})" for key, name in matches[1:])
+        reply.send(f"```Closest match for '{search}': {name} ({key}){f'{chr(10)}Other matches:{others}' if others else ''}```")
+    cache = ElementEmbeds if table == 'elements' else IonEmbeds
+    reply.send(embed=await cache.get(key))
+
+
+def read_element(search):  # search element table for entry matching given symbol
+    data = find_element(search)
+    if data is not None:
+        return element_embed(data)
+    else:
+        return None
+
+
+def element_embed(data):  # embed for ElementData
+    row = (data.name, data.symbol, data.number, data.charge, data.mass_text, data.group, data.electronegativity,
+           data.state)
+    result = []  # get data into list from tuple
+    for i in range(len(row)):
+        if row[i] in ('', None):
+            result.append('N/A')
+        else:
+            result.append(row[i])
+    embed = Embed(title=result[0],
+                          description=f'''
+    Symbol: {result[1]}
+    Atomic Number: {result[2]}
+    Ionic Charge: {result[3]}
+    Molar Mass: {result[4]}
+    Group: {result[5]}
+    Electronegativity: {result[6]}
+    State (SATP): {result[7]}
+    ''',
+                          color=4481855)
+    return embed
+
+
+def display_mass(mass):  # molar masses are saved in full precision (or as written in the csv file)
+    try:
+        return round(float(mass), 2)
+    except ValueError:
+        return mass
+
+
+def read_ion(search):  # similar code to read_element
+    data = find_ion(search)
+    if data is not None:
+        return ion_embed(data)
+    else:
+        return None
+
+
+def ion_embed(data):  # embed for IonData
+    row = (data.name, data.formula, data.charge, data.mass_text)
+    result = []
+    for i in range(len(row)):
+        if row[i] == '':
+            result.append('N/A')
+        else:
+            result.append(row[i])
+
+    result[1] = convert_subscript(result[1])  # converts coefficients to subscript
+
+    embed = Embed(title=result[0],
+                          description=f'''
+    Formula: {result[1]}
+    Ionic Charge: {result[2]}
+    Molar Mass: {display_mass(result[3])}
+    ''',
+                          color=4148027)
+    return embed
+
+
+class LookupCache:
+    # finished embeds for +database lookups (None for searches that aren't in the database), so repeated lookups
+    # don't format anything again. Embeds are shared between replies so they must not be changed.
+    # Entries are removed when their ion is added or deleted, and least recently used ones when there are over size
+    def __init__(self, read, size):
+        self.read = read  # function that searches element or ion table and returns embed
+        self.size = size
+        self.embeds = OrderedDict()  # search -> embed or None
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, search):
+        if search in self.embeds:
+            self.hits += 1
+            self.embeds.move_to_end(search)
+            return self.embeds[search]
+        self.misses += 1
+        embed = self.read(search)  # tables are in memory, so this doesn't wait for the database
+        self.add(search, embed)
+        return embed
+
+    def add(self, search, embed):
+        self.embeds[search] = embed
+        self.embeds.move_to_end(search)
+        while len(self.embeds) > self.size:
+            self.embeds.popitem(last=False)
+
+    def discard(self, search):
+        self.embeds.pop(search, None)
+
+    def clear(self):
+        self.embeds.clear()
+
+
+ElementEmbeds = LookupCache(read_element, ELEMENT_CACHE_SIZE)
+IonEmbeds = LookupCache(read_ion, ION_CACHE_SIZE)
+
+
+def trigrams(word):  # groups of 3 letters, with spaces around the word so short words and the ends count too
+    word = f"  {word} "
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+class SearchIndex:
+    # finds elements and ions from their name, symbol or formula (any case), the start of any of them, or a misspelling
+    # starts are found with a trie (nested dicts of letters, '' in each is the set of entries with a word starting with
+    # those letters), misspellings by the fraction of trigrams shared with a word. Entries are (table, symbol/formula)
+    def __init__(self):
+        self.trie = {}
+        self.trigrams = {}  # trigram -> set of (entry, word)
+        self.sizes = {}  # word -> number of trigrams in it
+        self.names = {}  # entry -> (name, words)
+
+    def add(self, table, key, name):
+        self.remove(table, key)
+        entry = (table, key)
+        words = {key.lower(), name.lower(), *name.lower().split()}  # each word too, for 'Hydrogen carbonate'
+        self.names[entry] = (name, words)
+        for word in words:
+            node = self.trie
+            for letter in word:
+                node = node.setdefault(letter, {})
+                node.setdefault('', set()).add(entry)
+            self.sizes[word] = len(trigrams(word))
+            for trigram in trigrams(word):
+                self.trigrams.setdefault(trigram, set()).add((entry, word))
+
+    def remove(self, table, key):
+        entry = (table, key)
+        if entry not in self.names:
+            return
+        name, words = self.names.pop(entry)
+        for word in words:
+            node = self.trie
+            for letter in word:
+                node = node[letter]
+                node[''].discard(entry)
+            for trigram in trigrams(word):
+                self.trigrams[trigram].discard((entry, word))
+
+    def load(self, rows):  # replace everything with (table, key, name) rows
+        self.__init__()
+        for row in rows:
+            self.add(*row)
+
+    def search(self, table, text, limit=SEARCH_RESULTS):  # [(key, name)] best match first
+        lowered = text.lower()
+        scores = {}
+        node = self.trie
+        for letter in lowered:
+            node = node.get(letter)
+            if node is None:
+                break
+        else:
+            for entry in node.get('', ()):
+                if entry[0] == table:
+                    name, words = self.names[entry]
+                    if entry[1] == text:  # exact formula (ion formulas are case sensitive, i.e. CO and Co)
+                        scores[entry] = 4
+                    elif lowered in (entry[1].lower(), name.lower()):
+                        scores[entry] = 3
+                    else:  # closer to 2 the more of the word was typed
+                        scores[entry] = 1 + len(lowered) / min(len(word) for word in words if word.startswith(lowered))
+        if not scores:  # nothing starts with the search, so look for misspellings
+            searched = trigrams(lowered)
+            shared = Counter()
+            for trigram in searched:
+                for entry, word in self.trigrams.get(trigram, ()):
+                    if entry[0] == table:
+                        shared[(entry, word)] += 1
+            for (entry, word), count in shared.items():
+                score = count / (len(searched) + self.sizes[word] - count)
+                if score >= FUZZY_MATCH and score > scores.get(entry, 0):
+                    scores[entry] = score
+        ranked = sorted(scores, key=lambda entry: (-scores[entry], len(self.names[entry][0]), entry[1]))[:limit]
+        return [(entry[1], self.names[entry][0]) for entry in ranked]
+
+
+Names = SearchIndex()
+
+
+def read_names():  # (table, key, name) for every element and ion
+    return ([('elements', data.symbol, data.name) for data in element_list()] +
+            [('ions', data.formula, data.name) for data in ion_list()])
+
+
+async def refresh_ion(formula):  # after an ion was added or deleted (here or by another process)
+    IonEmbeds.discard(formula)  # might have been saved as not found
+    data = find_ion(formula)  # ion table is updated before add_ion and delete_ion finish
+    if data is None:
+        Names.remove('ions', formula)
+    else:
+        Names.add('ions', formula, data.name)
+
+
+async def reload_lookups():  # after the database was reloaded
+    ElementEmbeds.clear()
+    IonEmbeds.clear()
+    Names.load(read_names())
+
+
+def warm_lookup_caches():  # make embed for every element and ion at startup (after database is prepared)
+    ElementEmbeds.clear()
+    IonEmbeds.clear()
+    Names.load(read_names())
+    for data in element_list():
+        ElementEmbeds.add(data.symbol, element_embed(data))
+    for data in ion_list()[:IonEmbeds.size]:
+        IonEmbeds.add(data.formula, ion_embed(data))
+
+
+async def sync_shared_data():  # pick up ions added or deleted by other bot processes (shards.py)
+    formulas = await Data.write(sync_ion_changes)
+    if '*' in formulas:
+        await reload_lookups()
+    else:
+        for formula in formulas:
+            await refresh_ion(formula)
+
+
+# metrics read when +stats is used or the metrics endpoint is requested
+
+def cache_lookups():  # (hits, misses) of each cache
+    formulas = parse_formula.cache_info()
+    return {
+        'equations': (EquationCache.hits + EquationCache.database_hits, EquationCache.misses),
+        'formulas': (formulas.hits, formulas.misses),
+        'elements': (ElementEmbeds.hits, ElementEmbeds.misses),
+        'ions': (IonEmbeds.hits, IonEmbeds.misses),
+    }
+
+
+def cache_lookup_gauge():
+    values = {}
+    for cache, (hits, misses) in cache_lookups().items():
+        values[(('cache', cache), ('result', 'hit'))] = hits
+        values[(('cache', cache), ('result', 'miss'))] = misses
+    return values
+
+
+Metrics.gauge('cache_lookups', cache_lookup_gauge, "lookups in each cache since startup")
+Metrics.gauge('queue_depth', lambda: {(('guild', guild),): waiting for guild, waiting in Jobs.waiting().items()},
+              "jobs waiting for a worker in each server's queue")
+Metrics.gauge('jobs_running', lambda: {(): Jobs.running}, "jobs running in worker processes")
+Metrics.gauge('sessions', lambda: {(): len(Sessions)}, "loaded stoichiometry equations")
@@ -0,0 +1,157 @@
+'''
+Counters and latency histograms for commands, shown with +stats and served in Prometheus text format on localhost
+(http://127.0.0.1:9108/metrics by default, CHEMBOT_METRICS_PORT=0 turns it off)
+'''
+# standard library
+import asyncio
+import contextvars
+import http.server
+import os
+import threading
+import time
+from collections import defaultdict
+
+METRICS_PORT = int(os.environ.get('CHEMBOT_METRICS_PORT', 9108))
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+PHASES = ('parse', 'compute', 'db', 'send')  # parts of a command that are timed
+
+Phases = contextvars.ContextVar('Phases', default=None)  # {phase: seconds} for the command being run
+
+
+def add_time(phase, seconds):  # adds to the command that is running (ignored outside commands)
+    phases = Phases.get()
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0) + seconds
+
+
+class Timer:  # with Timer('db'): ... adds time spent inside to the running command's phase
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *error):
+        add_time(self.phase, time.perf_counter() - self.start)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):  # upper bound of the bucket the quantile falls in (estimate)
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            if total >= target and count:
+                return bound
+        return 0
+
+
+class Registry:
+    # counters and histograms are labelled with a sorted tuple of (label, value) pairs
+    # gauges are functions that are called when metrics are read, returning {labels dict as tuple: value}
+    def __init__(self):
+        self.counters = defaultdict(lambda: defaultdict(int))  # name -> labels -> value
+        self.histograms = defaultdict(dict)  # name -> labels -> Histogram
+        self.gauges = {}  # name -> function
+        self.help = {}  # name -> description
+        self.lock = threading.Lock()  # metrics are read by the http server thread
+
+    def count(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, function, description=''):
+        self.gauges[name] = function
+        self.help[name] = description
+
+    def render(self):  # prometheus text format
+        lines = []
+        with self.lock:
+            for name, values in self.counters.items():
+                lines.append(f"# TYPE chembot_{name} counter")
+                for labels, value in values.items():
+                    lines.append(f"chembot_{name}{format_labels(labels)} {value}")
+            for name, values in self.histograms.items():
+                lines.append(f"# TYPE chembot_{name} histogram")
+                for labels, histogram in values.items():
+                    total = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        total += count
+                        lines.append(f"chembot_{name}_bucket{format_labels(labels + (('le', bound),))} {total}")
+                    lines.append(f"chembot_{name}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(f"chembot_{name}_count{format_labels(labels)} {histogram.count}")
+        for name, function in self.gauges.items():  # called outside lock since they read other objects
+            if self.help[name]:
+                lines.append(f"# HELP chembot_{name} {self.help[name]}")
+            lines.append(f"# TYPE chembot_{name} gauge")
+            for labels, value in function().items():
+                lines.append(f"chembot_{name}{format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{str(value)}"' for key, value in labels) + '}'
+
+
+Metrics = Registry()
+
+
+def serve(port=METRICS_PORT, loop=None):
+    # serve metrics on localhost in a background thread, gauges are read on loop (the bot's event loop) if given
+    # so they don't look at queues and caches while the loop is changing them. Returns the server, or None if off
+    if not port:
+        return None
+
+    def render():
+        if loop is None:
+            return Metrics.render()
+
+        async def render_in_loop():
+            return Metrics.render()
+        return asyncio.run_coroutine_threadsafe(render_in_loop(), loop).result(timeout=5)
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # don't print every request
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    print(f"Serving metrics on http://127.0.0.1:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,109 @@
+'''
+Opt-in cProfile sampling of commands, switched on with +profile (bot owner) or CHEMBOT_PROFILE=balance:0.1,calculate:1
+(command:fraction of uses to profile). Stats are added up for each command and saved to CHEMBOT_PROFILE_DIR
+as .prof files (open with snakeviz, flameprof or python -m pstats) when dumped or when the bot stops.
+Jobs a sampled command sends to worker processes are profiled there too, and added to the command's stats.
+When nothing is being profiled the only cost is checking an empty dict.
+'''
+# standard library
+import contextvars
+import cProfile
+import io
+import marshal
+import os
+import pathlib
+import pstats
+import random
+
+PROFILE_DIR = os.environ.get('CHEMBOT_PROFILE_DIR', 'profiles')
+
+Sampled = contextvars.ContextVar('Sampled', default=None)  # command being profiled, for jobs it sends to workers
+
+
+def parse_rates(text):  # 'balance:0.1,calculate' -> {'balance': 0.1, 'calculate': 1.0}
+    rates = {}
+    for item in text.split(','):
+        if item.strip():
+            command, _, rate = item.strip().partition(':')
+            rates[command] = float(rate) if rate else 1.0
+    return rates
+
+
+class Profiler:
+    # only one command is profiled at a time, since cProfile sees everything running on the event loop while
+    # it is on (other commands running at the same time are included in its stats)
+    def __init__(self, rates=None, directory=PROFILE_DIR):
+        self.rates = rates or {}  # command -> fraction of uses profiled, empty when profiling is off
+        self.directory = directory
+        self.stats = {}  # command -> pstats.Stats added up from every sample
+        self.samples = {}  # command -> number of samples
+        self.active = None  # profile currently running
+        self.token = None  # for resetting Sampled
+
+    def set_rate(self, command, rate):  # rate 0 stops profiling command (collected stats are kept)
+        if rate > 0:
+            self.rates[command] = min(rate, 1.0)
+        else:
+            self.rates.pop(command, None)
+
+    def start(self, command):  # returns running profile, or None if this use isn't sampled
+        rate = self.rates.get(command)
+        if rate is None or self.active is not None or random.random() >= rate:
+            return None
+        self.active = cProfile.Profile()
+        self.token = Sampled.set(command)
+        self.active.enable()
+        return self.active
+
+    def stop(self, command, profile):
+        profile.disable()
+        Sampled.reset(self.token)
+        self.active = None
+        self.add(command, profile)
+        self.samples[command] = self.samples.get(command, 0) + 1
+
+    def add(self, command, profile):  # cProfile.Profile, or WorkerStats from run_profiled()
+        if command in self.stats:
+            self.stats[command].add(profile)
+        else:
+            self.stats[command] = pstats.Stats(profile)
+
+    def summary(self, command, lines=10):  # top functions by cumulative time
+        stream = io.StringIO()
+        self.stats[command].stream = stream
+        self.stats[command].sort_stats('cumulative').print_stats(lines)
+        return stream.getvalue()
+
+    def dump(self):  # save stats of each command, returns list of files written
+        if not self.stats:
+            return []
+        directory = pathlib.Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for command, stats in self.stats.items():
+            path = directory / f"{command}.prof"
+            stats.dump_stats(path)
+            paths.append(path)
+        return paths
+
+    def clear(self):
+        self.stats.clear()
+        self.samples.clear()
+
+
+class WorkerStats:  # stats sent back by run_profiled(), in the form pstats.Stats reads from a profile
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+def run_profiled(function, *args):  # runs in worker process, returns result and marshalled stats
+    profile = cProfile.Profile()
+    result = profile.runcall(function, *args)
+    profile.create_stats()
+    return result, marshal.dumps(profile.stats)
+
+
+Profiles = Profiler(parse_rates(os.environ.get('CHEMBOT_PROFILE', '')))
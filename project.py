@@ -2,495 +2,363 @@
 title: Discord chemistry bot
 author: Daniel Zhang
 data-created: 2021-06-11
+
+Chemistry functions and database (importing this module doesn't import discord or touch the database,
+so worker processes and other scripts can use it without starting the bot).
+Commands are in engine.py, and are sent to discord by bot.py
 '''
 # standard library
+import asyncio
+import csv
+import hashlib
+import os
 import pathlib
 import sqlite3
-import re
-
-# required dependency | py -m pip install discord.py  (for windows)
-import discord
-from discord.ext import commands
-
-# optional dependency for equation balancing | py -m pip install sympy
-try:
-    from sympy import Matrix, lcm
-except ModuleNotFoundError:
-    print("Dependencies required to preform equation balancing were not found, stoichometric functions will be unavailable")
-
-Bot = commands.Bot(command_prefix='+', help_command=None)
-# change bot command prefix to '+' and create custom help command
+import threading
+import time
+import functools
+import itertools
+import math
+import mmap
+import struct
+from collections import deque, namedtuple, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import MappingProxyType
+
+from metrics import Timer
+from profiling import Profiles, Sampled, WorkerStats, run_profiled
 
 DATABASE = 'project.db'
 PERIODIC_TABLE = 'periodic_table.csv'  # taken from chemistry data booklet
 POLYATOMIC_IONS = 'polyatomic_ions.csv'
 
-DATABASE_EXISTS = (pathlib.Path.cwd() / DATABASE).exists()
-CONNECTION = sqlite3.Connection(DATABASE)
-CURSOR = CONNECTION.cursor()
+SCHEMA_VERSION = 2  # increase when tables change so old databases get rebuilt
+DATABASE_READERS = 3  # threads (each with a read only connection) used for database lookups
+SHARED_DATA = 'shared_data.bin'  # element and ion tables mapped by every process started by shards.py
+ION_CHANGES_KEPT = 1000  # rows kept in ion_changes, processes further behind than this reload everything
 
 # discord markdown has no subscript formatting option
 Subscript = {"1": "₁", "2": "₂", "3": "₃", "4": "₄", "5": "₅", "6": "₆", "7": "₇", "8": "₈", "9": "₉", "0": "₀", }
 Anti_Subscript = {i: j for j, i in Subscript.items()}
 
-CoefficientMatrix = []  # matrix of the number of each element of an unbalanced equation
-ElementList = []  # names of element for each matrix row
-LoadedEquation = []  # this will just be a list in a list to send data between functions
-EquationCoeff = []  # stores the coefficient, then name of molecule
+FORMULA_CACHE_SIZE = 1024  # number of parsed formulas kept by parse_formula()
+HYDRATE_DOTS = '.·*'  # separators for hydrates (CuSO4·5H2O, CuSO4.5H2O or CuSO4*5H2O)
+
+# cpu heavy commands (balancing) run in worker processes, these can be changed with environment variables
+WORKER_PROCESSES = int(os.environ.get('CHEMBOT_WORKERS', 2))
+JOB_TIMEOUT = float(os.environ.get('CHEMBOT_JOB_TIMEOUT', 5))  # seconds before a job is cancelled
+JOBS_PER_WORKER = int(os.environ.get('CHEMBOT_JOBS_PER_WORKER', 500))  # workers are replaced after this many jobs
+JOB_CONCURRENCY = int(os.environ.get('CHEMBOT_CONCURRENCY', WORKER_PROCESSES))  # jobs sent to workers at once
+# (never more than the number of workers, extra jobs would only wait in the pool where servers don't take turns)
+GUILD_QUEUE_LIMIT = int(os.environ.get('CHEMBOT_QUEUE_LIMIT', 20))  # jobs one server can have waiting
+GUILD_WEIGHTS = {  # turns in a row a server gets when others are waiting too, i.e. CHEMBOT_GUILD_WEIGHTS=1234:3,5678:2
+    int(guild): int(weight) for guild, weight in
+    (i.split(':') for i in os.environ.get('CHEMBOT_GUILD_WEIGHTS', '').split(',') if i)
+}
+MAX_EQUATION_LENGTH = 300  # characters
+MAX_MOLECULES = 20  # reactants and products combined
+MAX_BATCH_EQUATIONS = 200  # equations balanced by one +balance command (worksheets)
+MAX_BATCH_FORMULAS = 1000  # formulas worked out by one +calculate composition command (attachments, ions table)
+WORKER_MOLAR_MASS_BATCH = 200  # formulas needed before a molar mass batch is sent to a worker process
+EQUATION_CACHE_SIZE = 2048  # balanced equations kept in memory (they are also saved to database)
+SAVED_EQUATIONS = 100000  # balanced equations kept in database (oldest saved are deleted first)
+
+GAS_CONSTANT = 8.314  # gas constant for units used (kPa, L, mol, K)
+UNIT_TABLE = [  # (symbol, dimension, size in base unit, offset from base unit zero, names users can type)
+    # base units: kPa, K, L, g, mol, J  (value in base unit = value * size + offset)
+    ('kPa', 'pressure', 1, 0, ('kpa',)),
+    ('Pa', 'pressure', 0.001, 0, ('pa',)),
+    ('atm', 'pressure', 101.325, 0, ('atm',)),
+    ('mmHg', 'pressure', 101.325 / 760, 0, ('mmhg',)),
+    ('torr', 'pressure', 101.325 / 760, 0, ('torr',)),
+    ('bar', 'pressure', 100, 0, ('bar',)),
+    ('psi', 'pressure', 6.894757, 0, ('psi',)),
+    ('K', 'temperature', 1, 0, ('k', 'kelvin')),
+    ('°C', 'temperature', 1, 273.15, ('c', '°c', 'celsius')),
+    ('°F', 'temperature', 5 / 9, 273.15 - 32 * 5 / 9, ('f', '°f', 'fahrenheit')),
+    ('L', 'volume', 1, 0, ('l', 'litre', 'liter', 'dm3')),
+    ('mL', 'volume', 0.001, 0, ('ml', 'cm3', 'cc')),
+    ('m³', 'volume', 1000, 0, ('m3', 'm³')),
+    ('gal', 'volume', 3.785411784, 0, ('gal',)),
+    ('g', 'mass', 1, 0, ('g',)),
+    ('mg', 'mass', 0.001, 0, ('mg',)),
+    ('kg', 'mass', 1000, 0, ('kg',)),
+    ('t', 'mass', 1000000, 0, ('t', 'tonne')),
+    ('lb', 'mass', 453.59237, 0, ('lb',)),
+    ('oz', 'mass', 28.349523125, 0, ('oz',)),
+    ('mol', 'amount', 1, 0, ('mol',)),
+    ('mmol', 'amount', 0.001, 0, ('mmol',)),
+    ('kmol', 'amount', 1000, 0, ('kmol',)),
+    ('J', 'energy', 1, 0, ('j',)),
+    ('kJ', 'energy', 1000, 0, ('kj',)),
+    ('cal', 'energy', 4.184, 0, ('cal',)),
+    ('kcal', 'energy', 4184, 0, ('kcal',)),
+    ('eV', 'energy', 1.602176634e-19, 0, ('ev',)),
+    ('kWh', 'energy', 3600000, 0, ('kwh',)),
+]
+Unit = namedtuple('Unit', ['symbol', 'dimension', 'size', 'offset'])
+UNITS = {name: Unit(*row[:4]) for row in UNIT_TABLE for name in row[4]}  # typed name -> Unit
+CONVERSIONS = {  # (name, new name) -> (unit, new unit, multiplier, added), for every pair with the same dimension
+    (name, new_name): (unit.symbol, new_unit.symbol, unit.size / new_unit.size,
+                       (unit.offset - new_unit.offset) / new_unit.size)
+    for name, unit in UNITS.items() for new_name, new_unit in UNITS.items() if unit.dimension == new_unit.dimension
+}
+
+SESSION_LIMIT = 5000  # most loaded equations kept (least recently used are removed first)
+SESSION_TTL = 3600  # seconds a loaded equation is kept without being used
+
+# parsed rows of the elements and ions tables (mass is a float, charges a tuple of ints in order of stability)
+# mass_text and charge keep what was written in the csv file or by the user (significant figures) for displaying
+ElementData = namedtuple('ElementData', ['name', 'symbol', 'number', 'charge', 'charges', 'mass', 'mass_text', 'group',
+                                         'electronegativity', 'state'])  # electronegativity is None if not known
+IonData = namedtuple('IonData', ['name', 'formula', 'charge', 'charges', 'mass', 'mass_text'])  # mass can be None
+ElementTable = MappingProxyType({})  # symbol -> ElementData, read-only and rebuilt by load_element_table()
+IonTable = MappingProxyType({})  # formula -> IonData, rebuilt by load_ionic_table()
+
+IonicCompound = namedtuple('IonicCompound', ['formula', 'soluble', 'mass'])  # formula has subscripts, mass can be None
+IonCharges = MappingProxyType({})  # element or ion formula -> most common charge, rebuilt by load_ionic_table()
+IonicTable = MappingProxyType({})  # (cation, anion) -> IonicCompound for every pair of elements and ions
+LastIonChange = 0  # id of last row in ion_changes that the tables above include
+ShareIonChanges = False  # set by bot.py when other processes use the same database (shards.py)
+OwnIonChanges = set()  # ids of rows in ion_changes this process added (already in its tables)
 
 
-# coroutines (I already know the flowchart is going to be a mess)
+# subroutines
+# processing (input and outputs are mostly handled by the command systems
 
 
-@Bot.event
-async def on_ready():  # when bot connects
-    await Bot.change_presence(
-        activity=discord.Activity(type=discord.ActivityType.listening, name='your every command | +help')
-    )
-    print(f"{Bot.user} is online")
-
-
-@Bot.event
-async def on_disconnect():  # when bot disconnects
-    print(f"{Bot.user} has disconnected")
-
-
-@Bot.event
-async def on_command_error(ctx, error):  # when error (invalid command) is raised
-    await ctx.send(f"```Error: {str(error)} | type +help for list of commands```")
-
-# inputs/outputs  (commands)
-
-
-@Bot.command(name='help', aliases=['h', 'commands'])  # custom help command
-async def help_message(ctx):  # bot commands pass context (ctx) parameter always, and will crash if coroutine does not accept at least one parameter
-    # ctx contains the message object, as well as lets you reply directly with ctx.send('Message')
-    embed = discord.Embed(title="CSE2910 Chemistry Bot",
-                          description='''Bot that helps with chemistry and whilst taking up my processor power and RAM.                    
-\nCredit to Mohammad-Ali Bandzar for equation balancing code:
-\n(Bandzar, M.-A. (2020, May 27). Balancing Chemical Equations With Python. Medium. https://medium.com/swlh/balancing-chemical-equations-with-python-837518c9075b.)''',
-                          color=5935975)
-    embed.add_field(name="Element/Ion Database",
-                    value='''```
-+database (Element / Ion) (symbol): Gets element/ion data
-+database add (ion name) (ion formula) (charge)
-+database delete (ion name, * to reset databases)```''',
-                    inline=False)
-    embed.add_field(name="Balance Equation | +balance help",
-                    value='''```+balance (equation): \nBalances equations```''',
-                    inline=False)
-    embed.add_field(name="Unit Conversion | +convert help",
-                    value='```+convert (value) (conversion): \nConverts one unit to another```',
-                    inline=False)
-    embed.add_field(name="Ionic Compound Formation",
-                    value='```+ionic (pos ion) (neg ion): \nBalances and determines solubility (most common charge)```',
-                    inline=False)
-    embed.add_field(name="Calculations | +calculate help for more info",
-                    value='''```
-+calculate gas (p) (v) (n) (t)
-+calculate moles (formula)```''',
-                    inline=False)
-    embed.add_field(name="Stoichiometry | +stoich help for more info",
-                    value='''```
-+stoich load (equation)
-+stoich show
-+stoich calculate (id) (unit) (value) (id2) (unit2)```''',
-                    inline=False)
-    await ctx.send(embed=embed)
-
-
-@Bot.command(name='hello')  # say hello back
-async def hello(ctx):
-    message = await ctx.send(f"Hello! {ctx.author.mention}")
-    await message.add_reaction('\N{THUMBS UP SIGN}')
-
-
-@Bot.command(name='database', aliases=['data', 'dat', 'd'])  # reading, writing, deleting from database
-# aliases are just alternate names for command (+database and +data will run the same command)
-async def database(ctx, subcmd='', arg1=None, arg2=None, arg3=None):  # takes context, subcommand, and 3 arguements
-    # variables are given default values of 'None' so that error messages can be displayed
-    # subcmd, arg1-3 are all arguments (the first 4 words user types after command), and have default values
-    if subcmd.lower().startswith("e"):  # search periodic table for element
-        arg1 = arg1[:2].capitalize()
-        embed = read_element(arg1)
-        if embed is None:  # if read_element returns empty
-            await ctx.send("```Could not find element data.```")
-        else:
-            await ctx.send(embed=embed)
-    elif subcmd.lower().startswith('i'):  # search for ion
-        embed = read_ion(arg1)
-        if embed is None:  # if read_element returns empty
-            await ctx.send("```Could not find ion in database. (Ion names are case-sensitive.)```")
-        else:
-            await ctx.send(embed=embed)
-
-    elif subcmd.lower().startswith('a') or subcmd.lower().startswith('w') :  # adding ion (writing ion)
-        try:  # in case of row error
-            success = add_ion(arg1, arg2, arg3)  # success is the outcome of write command
-            if success == 'Success':
-                await ctx.send(f"```Successfully added {arg1} to database```")
-            elif success == 'Duplicate':
-                embed = read_ion(arg2)
-                await ctx.send("```Entry already exists within database; delete the entry first to modify it. | +data delete (formula)```")
-                await ctx.send(embed=embed)  # output ion data that is duplicated
-            else:
-                await ctx.send(f"```Invalid given formula: '{arg2}'```")
-        except TypeError:
-            await ctx.send('''```
-Invalid command format: use +data write (name) (formula) (ionic charge)
-Example: +data add Acetate CH3COO 1-```''')
-
-    elif subcmd.lower().startswith('d'):  # deleting ion
-        name = arg1
-        delete_ion(name)  # delete any ions matching the first given argument
-        if arg1 != '*':
-            await ctx.send(f"```Successfully deleted {arg1} from database```")
-        else:
-            await ctx.send(f"```Successfully reloaded database```")
-    else:
-        await ctx.send("```Invalid command format | +help for list of commands```")
-
-
-@Bot.command(name='conversion', aliases=["convert", 'con'])
-async def convert_unit(ctx, value='', conversion=''):  # parameters must always be strings
-    if value.lower().startswith("help"):  # list of conversions
-        await ctx.send('''```
-Command Format:
-+conversion (value) (conversion)```
-```
-Supported Conversions:
-> 'c-k'
-> 'k-c'
-> 'kpa-atm'
-> 'atm-kpa
-> 'kpa-mmhg'
-> 'mmhg-kpa'
-> 'mmhg-atm'
-> 'atm-mmhg'```''')
-        return
-    if value.isnumeric():  # is integer
-        decimal_places = 1
-        value = float(value)
-    else:
-        try:
-            decimal_places = len(value.split('.')[1])
-            value = float(value)
-        except ValueError:
-            await ctx.send("```Conversion value must be a number. | +convert help```")
-            return
-        except IndexError:
-            await ctx.send("```Conversion value must be a number. | +convert help```")
+class JobTimeout(Exception):  # job in worker process took longer than JOB_TIMEOUT
+    pass
+
+
+class InputTooLarge(ValueError):  # input is over the size limits for worker jobs
+    pass
+
+
+class QueueFull(Exception):  # server already has GUILD_QUEUE_LIMIT jobs waiting
+    def __str__(self):
+        return "The bot is busy with other requests from this server, try again in a moment."
+
+
+class WorkerPool:
+    # runs cpu heavy functions in other processes so one large equation can't freeze the bot's event loop
+    # processes are only started when the first job is sent, and are replaced every JOBS_PER_WORKER jobs
+    # only as many jobs as there are processes are sent at once, so the timeout starts when a job starts running
+    # instead of while it waits behind other jobs
+    def __init__(self, processes=WORKER_PROCESSES, timeout=JOB_TIMEOUT, jobs_per_worker=JOBS_PER_WORKER):
+        self.processes = processes
+        self.timeout = timeout
+        self.jobs_per_worker = jobs_per_worker
+        self.executor = None
+        self.jobs = 0  # jobs sent to current executor
+        self.outdated = False  # element table changed, so workers are replaced before the next job (set from any thread)
+        self.slots = None  # semaphore of free processes, made for each event loop (benchmark.py starts a few)
+        self.loop = None
+
+    def get_executor(self):
+        if self.executor is not None and (self.outdated or self.jobs >= self.jobs_per_worker * self.processes):
+            self.shutdown()  # recycle workers (running jobs still finish)
+        if self.executor is None:
+            self.outdated = False
+            # workers get a copy of the element table for molar masses, since they don't have database loaded
+            # (on windows and mac)
+            self.executor = ProcessPoolExecutor(self.processes, initializer=set_element_table,
+                                                initargs=(dict(ElementTable),))
+            self.jobs = 0
+        self.jobs += 1
+        return self.executor
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.slots, self.loop = asyncio.Semaphore(self.processes), loop
+        async with self.slots:
+            for attempt in range(2):
+                executor = self.get_executor()
+                try:
+                    return await asyncio.wait_for(loop.run_in_executor(executor, function, *args), self.timeout)
+                except asyncio.TimeoutError:
+                    # the worker is still stuck on the job, so it has to be stopped (executor can't tell which
+                    # process has the job, so all of them are, and the other jobs they had are tried again)
+                    if executor is self.executor:
+                        self.shutdown(kill=True)
+                    raise JobTimeout
+                except BrokenProcessPool:  # pool was killed by another job's timeout, so try again with new pool
+                    if executor is self.executor:
+                        self.shutdown()
+        raise JobTimeout
+
+    def shutdown(self, kill=False):
+        if self.executor is None:
             return
+        if kill:  # executor has no public way to stop running jobs
+            for process in list(self.executor._processes.values()):
+                process.terminate()
+        self.executor.shutdown(wait=False, cancel_futures=kill)  # jobs already sent still finish when recycling
+        self.executor = None
+
+
+Workers = WorkerPool()
+
+
+class Scheduler:
+    # decides the order jobs are sent to the worker pool so one server can't starve the others
+    # each server (guild, None for direct messages) has its own queue and servers take turns (a server with weight 3
+    # gets 3 jobs in a row), identical jobs that are already waiting or running share one result
+    def __init__(self, workers, concurrency=JOB_CONCURRENCY, queue_limit=GUILD_QUEUE_LIMIT, weights=GUILD_WEIGHTS):
+        self.workers = workers
+        self.concurrency = min(concurrency, workers.processes)
+        self.queue_limit = queue_limit
+        self.weights = weights
+        self.queues = OrderedDict()  # guild -> deque of (key, function, args, command being profiled or None)
+        # guild to take from next is first
+        self.turns = {}  # guild -> jobs taken from its queue in its current turn
+        self.jobs = {}  # key -> future, for every job waiting or running
+        self.running = 0
+
+    async def run(self, guild, key, function, *args):  # key is the same for jobs that have the same result
+        if key not in self.jobs:
+            queue = self.queues.setdefault(guild, deque())
+            if len(queue) >= self.queue_limit:
+                raise QueueFull
+            future = asyncio.get_running_loop().create_future()
+            future.add_done_callback(lambda future: future.cancelled() or future.exception())  # in case nobody waits
+            self.jobs[key] = future
+            queue.append((key, function, args, Sampled.get()))
+            self.start_jobs()
+        return await asyncio.shield(self.jobs[key])  # one caller giving up doesn't cancel it for the others
+
+    def start_jobs(self):
+        while self.running < self.concurrency and self.queues:
+            guild, queue = next(iter(self.queues.items()))
+            key, function, args, sampled = queue.popleft()
+            self.turns[guild] = self.turns.get(guild, 0) + 1
+            if not queue:
+                del self.queues[guild]
+                self.turns.pop(guild)
+            elif self.turns[guild] >= self.weights.get(guild, 1):  # turn is over, go to the back
+                self.turns[guild] = 0
+                self.queues.move_to_end(guild)
+            self.running += 1
+            asyncio.ensure_future(self.run_job(key, function, args, sampled))
+
+    async def run_job(self, key, function, args, sampled):
+        future = self.jobs[key]
+        try:
+            if sampled is None:
+                future.set_result(await self.workers.run(function, *args))
+            else:  # profile it in the worker too, since that's where the time goes
+                result, stats = await self.workers.run(run_profiled, function, *args)
+                Profiles.add(sampled, WorkerStats(stats))
+                future.set_result(result)
+        except Exception as error:
+            future.set_exception(error)
+        except BaseException:  # cancelled, everyone waiting for the job still needs an answer
+            future.set_exception(JobTimeout())
+            raise
+        finally:
+            del self.jobs[key]
+            self.running -= 1
+            self.start_jobs()
 
-    if conversion.lower() == 'c-k':  # C>K
-        await ctx.send(f"```{value}°C = {round(value + 273.15, decimal_places)}K```")
-    elif conversion.lower() == 'k-c':  # K>C
-        await ctx.send(f"```{value}K = {round(value - 273.15, decimal_places)}°C```")
-    elif conversion.lower() == 'kpa-atm':
-        await ctx.send(f"```{value}kPa = {round(value / 101.325, decimal_places)}Atm```")
-    elif conversion.lower() == 'atm-kpa':
-        await ctx.send(f"```{value}Atm = {round(value * 101.325, decimal_places)}kPa```")
-    elif conversion.lower() == 'kpa-mmhg':
-        await ctx.send(f"```{value}kPa = {round(value * 7.50062, decimal_places)}mmHg```")
-    elif conversion.lower() == 'mmhg-kpa':
-        await ctx.send(f"```{value}mmHg = {round(value / 7.50062, decimal_places)}kPa```")
-    elif conversion.lower() == 'mmhg-atm':
-        await ctx.send(f"```{value}mmHg = {round(value / 760, decimal_places)}Atm```")
-    elif conversion.lower() == 'atm-mmhg':
-        await ctx.send(f"```{value}Atm = {round(value * 760, decimal_places)}mmHg```")
-    else:
-        await ctx.send(f"```Could not find requested conversion | +convert help to show list of conversions```")
+    def waiting(self):  # jobs waiting in each server's queue
+        return {guild: len(queue) for guild, queue in self.queues.items()}
 
 
-@Bot.command(name='ionic', aliases=["soluble", 'sol', 'ion', 'i'])
-async def soluble(ctx, pos_ion, neg_ion):
-    result = test_soluble(pos_ion, neg_ion)
-    formula = balance_ionic(pos_ion, neg_ion)
-    if formula is not False:
-        if result:
-            await ctx.send(f"```The ions {pos_ion} and {neg_ion} will form {formula}, which is soluble in water```")
-        else:
-            await ctx.send(f"```The ions {pos_ion} and {neg_ion} will form {formula}, which is not soluble in water```")
-    else:
-        if result:
-            await ctx.send(f"```{pos_ion} and {neg_ion} will form a water soluble compound, but one or more ionic charges were not found in database.```")
-        else:
-            await ctx.send(f"```{pos_ion} and {neg_ion} will not form a water soluble compound, but one or more ionic charges were not found in database.```")
-
-
-@Bot.command(name='calculate', aliases=["cal", 'calc'])
-async def calculate(ctx, subcmd='', *args):  # *args returns a tuple of all arguments in command message after the first 2
-    if subcmd.lower().startswith('h'):  # help command
-        embed = discord.Embed(title="Calculations", color=6073213)
-        embed.add_field(name="Gas Law | +calculate gas (p) (v) (n) (t)",
-                        value='''```
-p: pressure in kPa
-v: volume of gas in L
-n: moles of gas
-t: temperature in K
-Replace a parameter with a word (i.e 'find') to calculate for value. (Any other non numeric value will also work)
-Example: +calculate gas 120 2.0 1.0 find```''',
-                        inline=False)
-
-        embed.add_field(name="Molar Mass | +calculate moles (formula)",
-                        value='''```
-formula: Ionic compound formula (case-sensitive)```''',
-                        inline=False)
-        await ctx.send(embed=embed)
-
-    elif subcmd.lower().startswith('g'):  # gas calculation
-        # PV = nRT (takes 4 arguments)
-        try:
-            p = args[0]
-            v = args[1]
-            n = args[2]
-            t = args[3]
-        except IndexError:
-            await ctx.send("```Incorrect number of parameters given | +calculate help```")
-            return
-        r = 8.314  # gas constant for units used
-        try:  # lots of error checking to figure out what the user inputted
-            # this is defnitely not good code, but I'm not sure how else to test for floats
-            p = float(p)
-            try:
-                v = float(v)
-                try:
-                    n = float(n)
-                    try:  # user inputted all values of gas law (so theres nothing to calculate for)
-                        t = float(t)
-                        await ctx.send("```Can't calculate if all the values are already provided```")
-                    except ValueError:  # calculate for t ans p, v, and n are floats and t is not
-                        t = (p*v)/(r*n)
-                        await ctx.send(f"```Temperature: {round(t, 5)}K```")
-                except ValueError:  # calculate n, as p and v are float and n is not float
-                    try:
-                        t = float(t)
-                        n = (p*v)/(r*t)
-                        await ctx.send(f"```Moles: {round(n, 5)} mol```")
-                    except ValueError:
-                        await ctx.send("```Invalid command format | +calculate help```")
-            except ValueError:  # calculating for v as p is float and v is not float
-                try:
-                    n = float(n)
-                    t = float(t)
-                    v = (n*r*t)/p
-                    await ctx.send(f"```Volume: {round(v, 5)}L```")
-                except ValueError:
-                    await ctx.send("```Invalid command format | +calculate help```")
-        except ValueError:  # calculating for p as p is not float
-            try:
-                v = float(v)
-                n = float(n)
-                t = float(t)
-                p = (n*r*t)/v
-                await ctx.send(f"```Pressure: {round(p, 5)}kPa```")
-            except ValueError:
-                await ctx.send("```Invalid command format | +calculate help```")
-
-    elif subcmd.lower().startswith('m'):  # molar mass calculation (takes only the first argument)
-        try:
-            result = molar_mass(args[0])
-        except IndexError:
-            await ctx.send("```Invalid command format | +calculate help```")
-            return
-        if not result:  # could not read formula
-            await ctx.send(f"```Invalid formula given: {args[0]} (Formulas are case-sensitive)```")
-        else:
-            formula = convert_subscript(args[0])
-            await ctx.send(f"```Molar mass of {formula}: {result} g/mol```")
+Jobs = Scheduler(Workers)
 
-    else:
-        await ctx.send("```Invalid command format | +calculate help```")
-
-
-@Bot.command(name='stoichiometry', aliases=["stoich", 'equation', 'e'])
-async def stoich_commands(ctx, subcmd, *args):
-    if subcmd.lower().startswith('h'):  # help
-        embed = discord.Embed(title="Chemical Equations (Stoichiometry)", color=4905928)
-        embed.add_field(name="Load equation | +stoich load (equation)",
-                        value='''```
-equation: unbalanced equation
-i.e. +cal stoich load NO3 + Co = Co(NO3)2```''',
-                        inline=False)
-        embed.add_field(name="Load equation | +stoich show",
-                        value='''```
-Shows currently loaded equation```''',
-                        inline=False)
-        embed.add_field(name="Load equation | +stoich calculate (id) (unit) (value) (id2) (unit2)",
-                        value='''```
-Converts amount of one substance to another based on balanced equation:
-id: id number of molecule
-unit: grams or moles (default to moles)
-value: number of grams or moles
-id2: id number of molecule to calculate for
-
-Example: +stoich cal 1 grams 20.3 3 grams```''',
-                        inline=False)
-        await ctx.send(embed=embed)
-
-    if subcmd.lower().startswith("l"):  # load equation
 
-        try:
-            equation = balance(''.join(args))  # try to balance
-        except IndexError:
-            await ctx.send("```Invalid equation formatting | +balance help for details```")
-            return
-        except TypeError:  # this shouldn't ever happen unless theres an bug (or polyatomic decomposition maybe)
-            await ctx.send("```Could not find a way to balance equation.```")
-            return
-        except NameError:  # means that prerequisite modules (sympy) were not installed
-            await ctx.send("```Dependencies for balancing were not found, cannot preform stoich commands.```")
-            return
+def set_element_table(table):  # used to give worker processes the element table
+    global ElementTable
+    ElementTable = MappingProxyType(table)
 
-        LoadedEquation.clear()
-        EquationCoeff.clear()  # clear previously saved data (if applicable)
-        LoadedEquation.append(equation)  # save equation to memory to display
-        for i in equation:
-            if not i.isdigit() and not i == '' and not i == ' + ' and not i == ' -> ':
-                coefficient = equation[equation.index(i) - 1]
-                if coefficient == '':
-                    coefficient = 1
-                else:
-                    coefficient = int(coefficient)
-                EquationCoeff.append([coefficient, convert_subscript(i, False)])
-                # save elements and their coefficients for calculations
-        await ctx.send("```Balanced equation loaded to memory.```")
-        await ctx.send(embed=show_equation())
-
-    elif subcmd.lower().startswith("s"):  # show loaded equation again
-        if LoadedEquation:  # if list is not empty
-            await ctx.send(embed=show_equation())
-        else:
-            await ctx.send("```Please load an equation first | +stoich load (equation)```")
 
-    elif subcmd.lower().startswith("c"):  # calculate with mole ratio
-        try:
-            index = abs(int(args[0])) - 1  # don't want to deal with negative index numbers
-            unit = args[1]
-            value = float(args[2])
-            output_index = abs(int(args[3])) - 1
-            output_unit = args[4]
-        except IndexError:
-            await ctx.send("```Invalid command format | +stoich help```")
-            return
-        except ValueError:
-            await ctx.send("```Invalid command format | +stoich help```")
-            return
-        if index < len(EquationCoeff) and output_index < len(EquationCoeff):
-            ratio = EquationCoeff[output_index][0] / EquationCoeff[index][0]
-            # mole ratio of requested molecule to given molecule
-
-            if unit.lower().startswith('g'):  # if user inputted grams, convert to moles
-                mole_mass = molar_mass(EquationCoeff[index][1])
-                if mole_mass is None:
-                    await ctx.send(f"```Could not find molar mass of molecule '{EquationCoeff[index][1]}'```")
-                    return
-                moles = value / mole_mass
-            else:  # if given unit was moles
-                moles = value
-
-            moles = moles * ratio  # calculate moles of requested molecule, convert from moles
-            output_molecule = convert_subscript(EquationCoeff[output_index][1])
-
-            if output_unit.lower().startswith('g'):  # if user wants answer in grams
-                mole_mass = molar_mass(EquationCoeff[output_index][1])
-                # we can reuse variable names since they are no longer needed
-                if mole_mass is None:
-                    await ctx.send(f"```Could not find molar mass of molecule '{output_molecule}'```")
-                    return
-                await ctx.send(f"```The calculated mass of {output_molecule} is {round(moles * mole_mass, 5)} grams.```")
-            else:
-                await ctx.send(f"```The calculated quantity of {output_molecule} is {round(moles, 5)} moles.```")
-    else:
-        await ctx.send("```Invalid command format | +stoich help```")
+def check_equation_size(equation):  # limits on what can be sent to worker processes
+    if len(equation) > MAX_EQUATION_LENGTH:
+        raise InputTooLarge(f"Equation is too long (limit is {MAX_EQUATION_LENGTH} characters).")
+    if equation.count('+') + equation.count('=') + 1 > MAX_MOLECULES:
+        raise InputTooLarge(f"Equation has too many molecules (limit is {MAX_MOLECULES}).")
 
 
-@Bot.command(name='balance', aliases=["b", 'bal'])
-async def balance_equation(ctx, *arg):
-    if arg[0].lower() == 'help':  # user has to type out all of help since equations can also start with h
-        embed = discord.Embed(title="Equation Balancing", color=4905928, description='''```
-+balance (unbalanced equation):
+def split_equation(equation):
+    # get reactants and products in separate lists, whitespace is removed and '->' can be used instead of '='
+    equation = ''.join(equation.split()).replace('->', '=').replace('→', '=')
+    check_equation_size(equation)
+    equation = equation.split('=')
+    reactants = equation[0].split('+')
+    products = equation[1].split('+')  # IndexError if there is no '='
+    return reactants, products
 
-i.e. +balance C6H12O6 + O2 = CO2 + H2O 
 
-> Equation is case-sensitive
-> Spaces between terms are technically optional
-> Use '=' instead of '->'
-> Only use brackets if they will be followed by coefficient
-(i.e. NaNO3, instead of Na(NO3))```''')
-        await ctx.send(embed=embed)
-    else:
-        try:
-            output = balance(''.join(arg))  # join arguments so spaces don't actually change output this way
-            if output is None:
-                await ctx.send("```Could not find a way to balance equation```")
-            else:
-                await ctx.send(f"```Balanced equation: {''.join(output)}```")
-        except IndexError:  # in theory all errors related to bad inputs are IndexErrors
-            await ctx.send("```Invalid command format | +balance help```")
-        except NameError:  # means that prerequisite modules (sympy) were not installed
-            await ctx.send("```Dependencies for balancing were not found, cannot preform equation balancing.```")
+def balance(equation):  # balance in current process (commands use balance_in_worker instead)
+    reactants, products = split_equation(equation)
+    coeff = EquationCache.get(reactants, products)
+    if coeff is NOT_CACHED:
+        coeff = solve_equation(reactants, products)
+        EquationCache.add(reactants, products, coeff)
+    return format_equation(reactants, products, coeff)
 
-# subroutines
-# processing (input and outputs are mostly handled by the command systems
 
+async def balance_in_worker(equation, guild=None):
+    # same as balance(), but only cache misses are sent to worker processes (guild is the server asking, for Jobs)
+    reactants, products, coeff = await coefficients_in_worker(equation, guild)
+    return format_equation(reactants, products, coeff)
 
-def transpose(matrix):
-    # transpose 'matrix' (sympy can do this too, but I would rather stay with standard library as much as possible)
-    rows = len(matrix)
-    columns = len(matrix[0])
 
-    new_matrix = []
-    for j in range(columns):
-        row = []
-        for i in range(rows):
-            row.append(matrix[i][j])
-        new_matrix.append(row)
-    return new_matrix
+async def balance_all_in_worker(equations, guild=None):
+    # balances list of equations at the same time, identical equations are only balanced once
+    # returns output of balance_in_worker for each equation (or the error it raised), in the same order
+    limit = asyncio.Semaphore(Workers.processes)  # so a long list doesn't fill the server's whole job queue
 
+    async def balance_one(equation):
+        async with limit:
+            try:
+                return await balance_in_worker(equation, guild)
+            except Exception as error:  # one bad equation shouldn't stop the rest
+                return error
 
-def balance(equation):
+    keys = [''.join(equation.split()) for equation in equations]  # spaces don't change the equation
+    unique = list(dict.fromkeys(keys))
+    results = dict(zip(unique, await asyncio.gather(*(balance_one(key) for key in unique))))
+    return [results[key] for key in keys]
 
-    CoefficientMatrix.clear()
-    ElementList.clear()
-    # in case there was error midway and function crashes, clear lists
-    equation = equation.split('=')
 
-    # get reactants and products in separate lists (have to make sure there are multiple terms '+' first)
-    reactants = equation[0].split('+')
-    products = equation[1].split('+')
+async def coefficients_in_worker(equation, guild=None):
+    # returns reactants, products and coefficients (None if can't balance)
+    with Timer('parse'):
+        reactants, products = split_equation(equation)
+    coeff = await EquationCache.get_async(reactants, products)
+    if coeff is NOT_CACHED:
+        key = ('solve', tuple(reactants), tuple(products))  # the same equation sent at the same time is solved once
+        coeff = await Jobs.run(guild, key, solve_equation, reactants, products)
+        EquationCache.add(reactants, products, coeff)
+    return reactants, products, coeff
+
+
+async def molar_mass_in_worker(formulas, guild=None):
+    # same as bulk_molar_mass(), but large batches are worked out in a worker process
+    if len(formulas) < WORKER_MOLAR_MASS_BATCH:  # quicker than sending them to another process
+        return bulk_molar_mass(formulas)
+    return await Jobs.run(guild, ('molar_mass', tuple(formulas)), bulk_molar_mass, formulas)
 
-    # starting here this is NOT MY ORIGINAL CODE: credit to Mohammad-Ali Bandzar:
+
+def solve_equation(reactants, products):  # returns list of coefficients, or None if the equation can't be balanced
+    # matrix and nullspace method credit to Mohammad-Ali Bandzar:
     # Bandzar, M.-A. (2020, May 27). Balancing Chemical Equations With Python. Medium. https://medium.com/swlh/balancing-chemical-equations-with-python-837518c9075b.
-    for i in range(len(reactants)):  # puts terms into matrix
-        add_matrix(reactants[i], i, 1)
-    for i in range(len(products)):
-        add_matrix(products[i], i + len(reactants), -1)  # product quantities are negative
+    matrix = composition_matrix(reactants, products)
+    return solve_coefficients(matrix)
 
-    # must use sympy (or numpy i think) to find null space
-    # I guess this function used for non-ib part of project(?)
-    # Without dependencies, everything but balancing and stoich will still work so its not really a problem
-    # (trying to reduce amount of modules used but no idea how to do this otherwise)
-    try:
-        answer = Matrix(transpose(CoefficientMatrix))  # converts to matrix object
-        answer = answer.nullspace()[0]  # take the first item in transposed null space matrix  (sympy method)
-    except IndexError:  # no answer was found (for whatever reason)
-        CoefficientMatrix.clear()
-        ElementList.clear()
-        return None
 
-    denominators = []  # get integer answers (since nullspace()[0] returns fractions)
-    for i in answer:
-        denominators.append(i.q)  # add denominators of each coefficient to find lcm
-        # .q means denominator in (p/q), since values in answers are actually sympy objects
-    multiple = lcm(denominators)
-    answer = answer * multiple   # multiply matrix by lcm
-    coeff = answer.tolist()  # turns matrix to array (sympy method)
+def format_equation(reactants, products, coeff):
+    if coeff is None:  # no answer was found
+        return None
 
     output = []
     for i in range(len(reactants)):
-        if coeff[i][0] != 1:
-            output.append(str(coeff[i][0]))  # add number if coefficient is not 1
+        if coeff[i] != 1:
+            output.append(str(coeff[i]))  # add number if coefficient is not 1
         else:
             output.append('')  # add blank string if coefficient is  1
         output.append(convert_subscript(reactants[i]))  # add string of corresponding reactant
@@ -500,73 +368,315 @@ def balance(equation):
     output.append(" -> ")
 
     for i in range(len(products)):
-        if coeff[i + len(reactants)][0] != 1:
-            output.append(str(coeff[i + len(reactants)][0]))
+        if coeff[i + len(reactants)] != 1:
+            output.append(str(coeff[i + len(reactants)]))
         else:
             output.append('')
         output.append(convert_subscript(products[i]))
         if i < len(products) - 1:
             output.append(" + ")
 
-    CoefficientMatrix.clear()
-    ElementList.clear()
-    # clear global lists so they don't hold up memory, and to allow for reuse of functions
     return output
 
 
-def add_matrix(compound, row, side):  # also NOT MY CODE (works with previous code)
-    # reg expressions to parse user input without comparing to entire periodic table
-    segments = re.split('(\([A-Za-z0-9]*\)[0-9])', compound)  # find anything surrounded by parenthesis
-    for segment in segments:
-        if segment.startswith("("):
-            segment = re.split('\)([0-9]*)', segment)  # find a ')' followed by a number of digits
-            multiplier = int(segment[1])  # i.e. in (NO3)2 multiplier is 2
-            segment = segment[0][1:]  # only get digits
+NOT_CACHED = object()  # returned by cache when equation has never been balanced (None means it can't be balanced)
+
+
+class BalanceCache:
+    # balanced coefficients saved under a canonical key (molecules sorted on each side) so "O2 + CH4" and "CH4 + O2"
+    # share an entry, recently used entries are kept in memory and everything is saved to balanced_equations table
+    def __init__(self, size=EQUATION_CACHE_SIZE):
+        self.size = size
+        self.memory = OrderedDict()  # key -> coefficients in canonical order, least recently used first
+        self.hits = 0  # found in memory
+        self.database_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def canonical(reactants, products):  # returns key, and the order molecules were sorted into
+        reactant_order = sorted(range(len(reactants)), key=reactants.__getitem__)
+        product_order = sorted(range(len(products)), key=products.__getitem__)
+        key = '+'.join(reactants[i] for i in reactant_order) + '=' + '+'.join(products[i] for i in product_order)
+        return key, reactant_order + [i + len(reactants) for i in product_order]
+
+    def remember(self, key, coeff):
+        self.memory[key] = coeff
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)  # remove least recently used
+
+    def get(self, reactants, products):  # look up memory then database in current thread
+        key, order = self.canonical(reactants, products)
+        coeff = self.find(key)
+        if coeff is NOT_CACHED:
+            coeff = self.found(key, self.load(key))
+        return self.reorder(coeff, order)
+
+    async def get_async(self, reactants, products):  # same as get, but database is read in reader thread
+        key, order = self.canonical(reactants, products)
+        coeff = self.find(key)
+        if coeff is NOT_CACHED:
+            coeff = self.found(key, await Data.read(self.load, key))
+        return self.reorder(coeff, order)
+
+    def find(self, key):  # memory only
+        if key not in self.memory:
+            return NOT_CACHED
+        self.hits += 1
+        self.memory.move_to_end(key)
+        return self.memory[key]
+
+    def found(self, key, coeff):  # count result of database lookup
+        if coeff is NOT_CACHED:
+            self.misses += 1
         else:
-            multiplier = 1  # blank means there is only 1 of the element
-
-        parsed_list = re.split('([A-Z][a-z]?)', segment)
-        # returns a list of of either element symbol or empty string/number in alternating order
-        # empty string means 1, and first number/empty string is the coefficient of the entire reactant
-        # CH4 becomes ['', 'C', '', 'H', '4']
-
-        i = 0
-        while i < len(parsed_list) - 1:  # read the list of elements/numbers
-            i += 1  # only increase by one if value is not zero (otherwise i should increment by 2)
-            if len(parsed_list[i]) > 0:
-                # element is not blank string
-                if parsed_list[i + 1].isdigit():  # matches all coefficients which are not blank
-                    amount = int(parsed_list[i + 1]) * multiplier  # take number and multiplier (element coefficient)
-                    if row == len(CoefficientMatrix):
-                        # if matrix needs new row (add row when row number is same as length of matrix), first element of each molecule will trigger this statement
-                        # new row for each reactant / product
-                        CoefficientMatrix.append([])
-                        for iteration in ElementList:
-                            CoefficientMatrix[row].append(0)  # fill row with a blank value for each element in molecule (create columns)
-                    if parsed_list[i] not in ElementList:  # if the element was not already added
-                        ElementList.append(parsed_list[i])  # add element to the list of elements (elements will be in same order so they can be put together)
-                        for j in range(len(CoefficientMatrix)):
-                            CoefficientMatrix[j].append(0)
-
-                    col = ElementList.index(parsed_list[i])  # find row number of element in the element list
-                    CoefficientMatrix[row][col] += amount * side  # side is 1 for reactants is -1 for products
-                    # replaces the zero with an actual number (amount of that element)
-                    i += 1  # add extra 1 to i to get to the next number in list (skip the elements)
-
-                else:  # blank just means 1 (code is still the same as above
-                    amount = multiplier  # since the amount is 1, 1 * multiplier is = multiplier
-                    if row == len(CoefficientMatrix):
-                        CoefficientMatrix.append([])
-                        for iteration in ElementList:
-                            CoefficientMatrix[row].append(0)
-                    if parsed_list[i] not in ElementList:
-                        ElementList.append(parsed_list[i])
-                        for j in range(len(CoefficientMatrix)):
-                            CoefficientMatrix[j].append(0)
-                    col = ElementList.index(parsed_list[i])
-                    CoefficientMatrix[row][col] += amount * side
-
-# everything after this is my code again
+            self.database_hits += 1
+            self.remember(key, coeff)
+        return coeff
+
+    @staticmethod
+    def load(key):  # database only (runs in reader thread)
+        row = Data.fetchone("SELECT coefficients FROM balanced_equations WHERE equation = ?", [key])
+        if row is None:
+            return NOT_CACHED
+        return tuple(int(i) for i in row[0].split()) if row[0] else None  # blank means it can't be balanced
+
+    @staticmethod
+    def reorder(coeff, order):  # put coefficients back in the order the user typed the molecules
+        if coeff is NOT_CACHED or coeff is None:
+            return coeff
+        result = [0] * len(order)
+        for position, index in enumerate(order):
+            result[index] = coeff[position]
+        return result
+
+    def add(self, reactants, products, coeff):
+        key, order = self.canonical(reactants, products)
+        if coeff is not None:
+            coeff = tuple(coeff[i] for i in order)
+        self.remember(key, coeff)
+        Data.submit_write(self.save, key, coeff)  # saved by writer thread, doesn't wait
+
+    @staticmethod
+    def save(key, coeff):
+        connection = Data.writer()
+        connection.execute("INSERT OR REPLACE INTO balanced_equations VALUES(?, ?);",
+                           [key, ' '.join(str(i) for i in coeff) if coeff is not None else ''])
+        # replaced rows get a new rowid, so rows more than SAVED_EQUATIONS rowids behind were saved longest ago
+        connection.execute("DELETE FROM balanced_equations "
+                           "WHERE rowid <= (SELECT max(rowid) FROM balanced_equations) - ?;", [SAVED_EQUATIONS])
+        connection.commit()
+
+    def clear(self):
+        self.memory.clear()
+        self.hits = self.database_hits = self.misses = 0
+        Data.submit_write(self.delete_saved)
+
+    @staticmethod
+    def delete_saved():
+        connection = Data.writer()
+        connection.execute("DELETE FROM balanced_equations;")
+        connection.commit()
+
+    def stats(self):  # reads database, so run in reader thread
+        saved = Data.fetchone("SELECT COUNT(*) FROM balanced_equations")[0]
+        return {'memory': len(self.memory), 'saved': saved, 'hits': self.hits,
+                'database_hits': self.database_hits, 'misses': self.misses}
+
+
+EquationCache = BalanceCache()
+
+
+StoichSession = namedtuple('StoichSession', ['equation', 'coefficients', 'formulas', 'masses', 'reactants'])
+# loaded equation for one user, everything +stoich calculate needs is worked out once when equation is loaded
+# reactants is the number of reactants (they come before the products in the other tuples)
+
+
+def create_session(reactants, products, coeff):
+    formulas = tuple(reactants + products)
+    masses = tuple(molar_mass(i) or None for i in formulas)  # None if molar mass could not be found
+    return StoichSession(''.join(format_equation(reactants, products, coeff)), tuple(coeff), formulas, masses,
+                         len(reactants))
+
+
+def stoich_table(session, amounts):
+    # amounts is {index: moles} for any of the reactants, returns (limiting reactant index, moles used or made
+    # of every molecule, {index: moles left over} for the given reactants)
+    extents = {i: moles / session.coefficients[i] for i, moles in amounts.items()}  # times the reaction can happen
+    limiting = min(extents, key=extents.get)
+    changes = [extents[limiting] * coefficient for coefficient in session.coefficients]
+    return limiting, changes, {i: moles - changes[i] for i, moles in amounts.items()}
+
+
+def session_key(caller):  # each user has separate loaded equation in each channel (guild is None in direct messages)
+    return caller.guild, caller.channel, caller.user
+
+
+class SessionStore:
+    # loaded equations are removed after SESSION_TTL seconds without use, or when there are more than SESSION_LIMIT
+    # (least recently used first)
+    def __init__(self, size=SESSION_LIMIT, ttl=SESSION_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.sessions = OrderedDict()  # key -> [last used time, session], least recently used first
+
+    def get(self, key):
+        entry = self.sessions.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:  # expired
+            del self.sessions[key]
+            return None
+        entry[0] = time.monotonic()
+        self.sessions.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, session):
+        self.remove_expired()
+        self.sessions[key] = [time.monotonic(), session]
+        self.sessions.move_to_end(key)
+        while len(self.sessions) > self.size:
+            self.sessions.popitem(last=False)
+
+    def remove_expired(self):
+        now = time.monotonic()
+        while self.sessions:  # sessions are in order of last use, so stop at first one that hasn't expired
+            last_used = next(iter(self.sessions.values()))[0]
+            if now - last_used <= self.ttl:
+                break
+            self.sessions.popitem(last=False)
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+Sessions = SessionStore()
+
+
+class UnderdeterminedEquation(Exception):  # equation can be balanced in more than one independent way
+    def __init__(self, solutions):
+        super().__init__(solutions)  # only number is passed to Exception so the error can be sent back from workers
+        self.solutions = solutions
+
+    def __str__(self):
+        return f"Equation has {self.solutions} independent ways to balance, it is probably two reactions combined."
+
+
+def solve_coefficients(matrix):
+    # find smallest positive whole number coefficients in the null space of the matrix (used to need sympy for this)
+    # row reduction only uses integers (every row operation is cross multiplied then divided by gcd, no fractions)
+    # returns None if there is no positive answer, raises UnderdeterminedEquation if there is more than one answer
+    rows = [row[:] for row in matrix]  # copy so the matrix passed in isn't changed
+    columns = len(rows[0])
+    pivots = []  # column of the leading number for each reduced row
+    for column in range(columns):
+        row = len(pivots)
+        pivot_row = next((i for i in range(row, len(rows)) if rows[i][column] != 0), None)
+        if pivot_row is None:  # column has no leading number, so it is a free variable
+            continue
+        rows[row], rows[pivot_row] = rows[pivot_row], rows[row]
+        pivot = rows[row][column]
+        for i in range(len(rows)):  # eliminate column from every other row
+            if i != row and rows[i][column] != 0:
+                factor = rows[i][column]
+                rows[i] = [pivot * a - factor * b for a, b in zip(rows[i], rows[row])]
+                divisor = math.gcd(*rows[i])
+                if divisor > 1:  # keep numbers small
+                    rows[i] = [a // divisor for a in rows[i]]
+        pivots.append(column)
+        if len(pivots) == len(rows):
+            break
+
+    free = [column for column in range(columns) if column not in pivots]
+    if not free:  # only answer is all zeros
+        return None
+    if len(free) > 1:
+        raise UnderdeterminedEquation(len(free))
+
+    # each pivot row reads pivot * x[pivot] + value * x[free] = 0, so set x[free] to lcm of pivots to stay whole numbers
+    free = free[0]
+    multiple = math.lcm(*(rows[i][column] for i, column in enumerate(pivots)))
+    coeff = [0] * columns
+    coeff[free] = multiple
+    for i, column in enumerate(pivots):
+        coeff[column] = -rows[i][free] * (multiple // rows[i][column])
+
+    if all(i < 0 for i in coeff):  # answer can be negated
+        coeff = [-i for i in coeff]
+    elif not all(i > 0 for i in coeff):  # molecules with zero or negative amounts can't be balanced
+        return None
+    divisor = math.gcd(*coeff)
+    return [i // divisor for i in coeff]
+
+
+def composition_matrix(reactants, products):
+    # matrix of the number of each element in each molecule, rows are elements and columns are molecules
+    # everything is kept local so balancing doesn't share any state between calls
+    elements = []  # element for each matrix row
+    matrix = []
+    for column, compound in enumerate(reactants + products):
+        side = 1 if column < len(reactants) else -1  # product quantities are negative
+        for element, count in parse_formula(compound):
+            if element not in elements:  # new row for each element (filled with zeros for every molecule)
+                elements.append(element)
+                matrix.append([0] * (len(reactants) + len(products)))
+            matrix[elements.index(element)][column] += count * side
+    return matrix
+
+
+@functools.lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def parse_formula(formula):
+    # single pass tokenizer used by both molar mass and balancing, returns ((element, count), ...) in order of appearance
+    # handles nested brackets Ca3(PO4)2 or K4[Fe(CN)6], multi-digit counts and hydrates CuSO4·5H2O
+    # results are cached by formula string (tuples so cached values can't be modified), ValueError if formula is invalid
+    total = {}
+    stack = [{}]  # element counts for each open bracket, first one is the current part of a hydrate
+    i = read_count(formula, 0)[1]  # coefficient in front of whole formula is ignored
+    multiplier = 1  # number in front of hydrate part (5 in ·5H2O)
+    while i < len(formula):
+        char = formula[i]
+        if char.isupper():  # start of element symbol, lowercase letters after are part of the symbol
+            j = i + 1
+            while j < len(formula) and formula[j].islower():
+                j += 1
+            symbol = formula[i:j]
+            count, i = read_count(formula, j)
+            stack[-1][symbol] = stack[-1].get(symbol, 0) + count
+        elif char in '([':
+            stack.append({})
+            i += 1
+        elif char in ')]':
+            if len(stack) == 1:  # closing bracket without opening bracket
+                raise ValueError(f"Unmatched bracket in {formula}")
+            group = stack.pop()
+            count, i = read_count(formula, i + 1)
+            add_counts(stack[-1], group, count)
+        elif char in HYDRATE_DOTS and len(stack) == 1:
+            add_counts(total, stack[0], multiplier)
+            stack[0] = {}
+            multiplier, i = read_count(formula, i + 1)
+        else:
+            raise ValueError(f"Could not read '{char}' in {formula}")
+    if len(stack) > 1:
+        raise ValueError(f"Unclosed bracket in {formula}")
+    add_counts(total, stack[0], multiplier)
+    if not total:
+        raise ValueError(f"No elements found in {formula}")
+    return tuple(total.items())
+
+
+def read_count(formula, i):  # read number starting at index i, returns (number, index after number), blank means 1
+    j = i
+    while j < len(formula) and formula[j].isdigit():
+        j += 1
+    if j == i:
+        return 1, i
+    return int(formula[i:j]), j
+
+
+def add_counts(counts, group, multiplier):  # add element counts of group to counts
+    for element, count in group.items():
+        counts[element] = counts.get(element, 0) + count * multiplier
 
 
 def gcd(a, b):  # i guess this was technically invented by euclid
@@ -575,55 +685,232 @@ def gcd(a, b):  # i guess this was technically invented by euclid
     return gcd(b % a, a)
 
 
-def balance_ionic(pos_ion, neg_ion):
-    global CURSOR
-    # get charge from database
-    charge1 = CURSOR.execute("SELECT charge FROM elements WHERE symbol = ?", [pos_ion]).fetchone()
-    if charge1 is None:
-        charge1 = CURSOR.execute("SELECT charge FROM ions WHERE formula = ?", [pos_ion]).fetchone()
-
-    charge2 = CURSOR.execute("SELECT charge FROM elements WHERE symbol = ?", [neg_ion]).fetchone()
-    if charge2 is None:
-        charge2 = CURSOR.execute("SELECT charge FROM ions WHERE formula = ?", [neg_ion]).fetchone()
-    if charge1 is not None and charge2 is not None:
-        # as long as we have charges for both (this could crash if user added charges are invalid)
-        charge2 = charge2[0][0]  # take most common (first) ionic charge
-        charge1 = charge1[0][0]
-        if charge1.isnumeric() and charge2.isnumeric():
-            charge1 = int(charge1)
-            charge2 = int(charge2)
-            divisor = gcd(charge1, charge2)
-            charge1 = charge1 // divisor
-            charge2 = charge2 // divisor
-
-            coeff1, coeff2 = charge2, charge1  # charges are really charges anymore, but rather just inverted coeff
-
-            if not coeff1 == 1:  # need brackets for polyatomic ions
-                if len(pos_ion) > 2 or len(pos_ion) == 2 and pos_ion.isupper():  # if longer than 2 or has 2 capitals (2 elements)
-                    pos_ion = f"({pos_ion})"
-                else:  # or theres a number in the ion formula
-                    for i in pos_ion:
-                        if i.isnumeric():
-                            pos_ion = f"({pos_ion})"
-                            break
-            else:
-                coeff1 = ''
-            if not coeff2 == 1:  # need brackets for polyatomic ions
-                if len(neg_ion) > 2 or len(neg_ion) == 2 and neg_ion.isupper():  # if longer than 2 or has 2 capitals (2 elements)
-                    neg_ion = f"({neg_ion})"
-                else:  # or theres a number in the ion formula
-                    for i in neg_ion:
-                        if i.isnumeric():
-                            neg_ion = f"({neg_ion})"
-                            break
-            else:
-                coeff2 = ''
-            formula = f"{pos_ion}{coeff1}{neg_ion}{coeff2}"
-            return convert_subscript(formula)
-        else:
-            return False
+def gas_law(p, v, n, t, r=GAS_CONSTANT):
+    # PV = nRT, the value to calculate is None; returns which value was calculated and its value
+    if p is None:
+        return 'p', (n*r*t)/v
+    if v is None:
+        return 'v', (n*r*t)/p
+    if n is None:
+        return 'n', (p*v)/(r*t)
+    return 't', (p*v)/(r*n)
+
+
+def gas_constant(pressure='kpa', volume='l'):  # R for other pressure and volume units (n in mol, t in K)
+    pressure, volume = UNITS.get(pressure.lower()), UNITS.get(volume.lower())
+    if pressure is None or volume is None or (pressure.dimension, volume.dimension) != ('pressure', 'volume'):
+        return None
+    return GAS_CONSTANT / (pressure.size * volume.size)
+
+
+def gas_law_table(values, r=GAS_CONSTANT):
+    # values is {'p': [...], 'v': [...], 'n': [...], 't': [...]} with None for the value to calculate
+    # for the combined gas law the keys are p1, v1, n1, t1, p2, v2, n2, t2 (R is then found from the complete state)
+    # every combination of the given values is calculated, returns rows of {name: value} (None if division by 0)
+    unknown = [name for name, given in values.items() if given is None][0]
+    names = [name for name in values if name != unknown]
+    state = unknown[1:]  # '' for ideal gas law, '1' or '2' for combined gas law
+    other = {'1': '2', '2': '1'}.get(state)
+    rows = []
+    for combination in itertools.product(*(values[name] for name in names)):
+        row = dict(zip(names, combination))
+        try:
+            if other is not None:  # p1v1/n1t1 = p2v2/n2t2, so R is the complete state's pv/nt
+                r = row['p' + other] * row['v' + other] / (row['n' + other] * row['t' + other])
+            row[unknown] = gas_law(*(row.get(i + state) for i in 'pvnt'), r=r)[1]
+        except ZeroDivisionError:
+            row[unknown] = None
+        rows.append(row)
+    return rows
+
+
+def find_unit(name):  # Unit for a name like 'kpa', or a ratio of two units like 'kj/mol', None if unknown
+    name = name.lower()
+    if name in UNITS:
+        return UNITS[name]
+    if name.count('/') == 1:
+        top, bottom = (UNITS.get(i) for i in name.split('/'))
+        if top is not None and bottom is not None and not top.offset and not bottom.offset:  # °C/L doesn't mean much
+            return Unit(f"{top.symbol}/{bottom.symbol}", f"{top.dimension}/{bottom.dimension}",
+                        top.size / bottom.size, 0)
+    return None
+
+
+def find_conversion(unit, new_unit):  # (unit, new unit, multiplier, added), or None if units can't be converted
+    conversion = CONVERSIONS.get((unit.lower(), new_unit.lower()))
+    if conversion is None:  # not two simple units, so try ratios (i.e. kJ/mol to J/mol)
+        unit, new_unit = find_unit(unit), find_unit(new_unit)
+        if unit is None or new_unit is None or unit.dimension != new_unit.dimension:
+            return None
+        conversion = (unit.symbol, new_unit.symbol, unit.size / new_unit.size, 0)
+    return conversion
+
+
+def convert_unit(values, conversion):
+    # conversion is 'unit-new unit' (i.e. 'c-k'), returns (unit, converted values, new unit), or None if unknown
+    if conversion.count('-') != 1:
+        return None
+    conversion = find_conversion(*conversion.split('-'))
+    if conversion is None:
+        return None
+    unit, new_unit, multiplier, added = conversion
+    return unit, [value * multiplier + added for value in values], new_unit
+
+
+def balance_ionic(pos_ion, neg_ion):  # formula of compound (with subscripts), or False if either charge isn't known
+    compound = IonicTable.get((pos_ion, neg_ion))
+    return compound.formula if compound is not None else False
+
+
+def find_ionic_compound(pos_ion, neg_ion):  # IonicCompound, or None if they aren't a known cation and anion
+    return IonicTable.get((pos_ion, neg_ion))
+
+
+def ionic_table(ion=None):  # list of ((cation, anion), IonicCompound), only pairs with ion if given
+    return [(pair, compound) for pair, compound in IonicTable.items() if ion is None or ion in pair]
+
+
+def ionic_compound(cation, cation_charge, anion, anion_charge):  # charges are both positive
+    divisor = gcd(cation_charge, anion_charge)
+    cations, anions = anion_charge // divisor, cation_charge // divisor
+    formula = bracket(cation, cations) + bracket(anion, anions)
+    # mass from the ions' masses, so thousands of compound formulas don't push everything else out of parse cache
+    cation_mass, anion_mass = molar_mass(cation), molar_mass(anion)
+    mass = cation_mass * cations + anion_mass * anions if cation_mass and anion_mass else None
+    return IonicCompound(convert_subscript(formula), test_soluble(cation, anion), mass)
+
+
+def bracket(ion, count):  # ion with number after it, polyatomic ions need brackets (i.e. (NO3)2)
+    if count == 1:
+        return ion
+    if len(ion) > 2 or len(ion) == 2 and ion.isupper() or any(i.isnumeric() for i in ion):
+        return f"({ion}){count}"  # if longer than 2, has 2 capitals (2 elements) or theres a number in the formula
+    return f"{ion}{count}"
+
+
+def first_charge(text):  # most common (first) charge from text like '2+ 3+', None if there isn't one
+    try:
+        return parse_charges(str(text))[0]
+    except (ValueError, IndexError):  # charge added by a user that isn't like '2+'
+        return None
+
+
+def ion_charge(formula):  # charge of element or ion, None if not found
+    data = ElementTable.get(formula) or IonTable.get(formula)  # elements come first like they always have
+    return data.charges[0] if data is not None and data.charges else None
+
+
+def find_element(symbol):  # ElementData, or None
+    return ElementTable.get(symbol)
+
+
+def find_ion(formula):  # IonData, or None
+    return IonTable.get(formula)
+
+
+def element_list():
+    return list(ElementTable.values())
+
+
+def ion_list():
+    return list(IonTable.values())
+
+
+def ion_data(row):  # IonData from row of ions table (name, formula, charge, molar mass)
+    name, formula, charge, mass = row
+    try:
+        charges = parse_charges(str(charge))
+    except ValueError:  # charge added by a user that isn't like '2+'
+        charges = ()
+    try:
+        value = float(str(mass).strip('()'))
+    except ValueError:
+        value = None
+    return IonData(name, formula, str(charge), charges, value, str(mass))
+
+
+def read_ion_table(formulas=None):  # {formula: IonData} for every ion, or only the ones given
+    if formulas is None:
+        rows = Data.fetchall("SELECT name, formula, charge, molar_mass FROM ions ;")
     else:
-        return False
+        formulas = list(formulas)
+        rows = Data.fetchall(f"SELECT name, formula, charge, molar_mass FROM ions WHERE formula IN "
+                             f"({', '.join('?' * len(formulas))}) ;", formulas)
+    return {row[1]: ion_data(row) for row in rows}
+
+
+def load_ionic_table():  # work out formula, solubility and molar mass of every cation and anion pair
+    global IonTable, IonCharges, IonicTable, LastIonChange
+    LastIonChange = Data.fetchone("SELECT max(id) FROM ion_changes;")[0] or 0  # before reading ions so none are missed
+    IonTable = MappingProxyType(read_ion_table())
+    charges = {symbol: data.charges[0] for symbol, data in ElementTable.items() if data.charges}
+    for formula, data in IonTable.items():
+        charges.setdefault(formula, data.charges[0] if data.charges else None)  # elements come first like always
+    charges = {formula: charge for formula, charge in charges.items() if charge}
+    table = {}
+    for cation, cation_charge in charges.items():
+        if cation_charge > 0:
+            for anion, anion_charge in charges.items():
+                if anion_charge < 0:
+                    table[(cation, anion)] = ionic_compound(cation, cation_charge, anion, -anion_charge)
+    IonCharges = MappingProxyType(charges)
+    IonicTable = MappingProxyType(table)  # replaced all at once so commands never see half a table
+
+
+def update_ionic_table(formulas):  # only recalculate pairs with the ions that were added or deleted
+    global IonTable, IonCharges, IonicTable
+    formulas = set(formulas)
+    IonTable = replace_items(IonTable, formulas, read_ion_table(formulas))
+    removed = [pair for pair in IonicTable if pair[0] in formulas or pair[1] in formulas]
+    changed = {formula: ion_charge(formula) for formula in formulas}
+    charges = replace_items(IonCharges, formulas, {formula: charge for formula, charge in changed.items() if charge})
+    added = {}
+    for formula, charge in changed.items():
+        if charge:
+            for other, other_charge in charges.items():
+                if charge > 0 > other_charge:
+                    added[(formula, other)] = ionic_compound(formula, charge, other, -other_charge)
+                elif charge < 0 < other_charge:
+                    added[(other, formula)] = ionic_compound(other, other_charge, formula, -charge)
+    IonCharges = charges
+    IonicTable = replace_items(IonicTable, removed, added)
+
+
+def replace_items(table, removed, added):  # new read only table with keys removed and added (never changed in place)
+    if isinstance(table, MappedTable):
+        return table.replace(removed, added)
+    removed = set(removed)
+    items = {key: value for key, value in table.items() if key not in removed}
+    items.update(added)
+    return MappingProxyType(items)
+
+
+def sync_ion_changes():
+    # apply ions added or deleted by other processes using the same database (writer thread)
+    # returns formulas that changed, '*' means everything was reloaded
+    global LastIonChange
+    rows = Data.writer().execute("SELECT id, formula FROM ion_changes WHERE id >= ?;", [LastIonChange]).fetchall()
+    # the row the tables were made at is kept unless this process fell behind and rows it needed were pruned
+    if LastIonChange:
+        behind = not rows or rows[0][0] != LastIonChange
+    else:  # no changes were made before the tables, so every row since the first one (id 1) is needed
+        behind = bool(rows) and rows[0][0] != 1
+    rows = [row for row in rows if row[0] > LastIonChange]
+    if rows:
+        LastIonChange = rows[-1][0]
+    # own changes are already applied, blank rows are only saved by export_shared_data to mark where the file is at
+    formulas = list(dict.fromkeys(row[1] for row in rows if row[0] not in OwnIonChanges and row[1]))
+    OwnIonChanges.difference_update(row[0] for row in rows)
+    if behind:
+        formulas = ['*']
+    if not formulas:
+        return []
+    if '*' in formulas:
+        load_element_table()
+        load_ionic_table()
+    else:
+        update_ionic_table(formulas)
+    return formulas
 
 
 def test_soluble(pos_ion, neg_ion):
@@ -656,163 +943,536 @@ def test_soluble(pos_ion, neg_ion):
         return False
 
 
+class Database:
+    # everything that uses the database goes through here so commands never wait for sqlite on the event loop
+    # reads run in a few threads that each have a read only connection, writes are done in order by one writer thread
+    # (database is in WAL mode so reads and the writer don't block each other)
+    def __init__(self, path, readers=DATABASE_READERS):
+        self.path = path
+        self.readers = readers
+        self.read_executor = None  # thread pools are started on first use
+        self.write_executor = None
+        self.local = threading.local()  # connections for each thread
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connect(self, read_only):
+        if read_only:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL;")
+            connection.execute("PRAGMA synchronous=NORMAL;")  # WAL is still safe from corruption with this
+            connection.execute("CREATE TABLE IF NOT EXISTS balanced_equations(equation TEXT PRIMARY KEY, coefficients TEXT);")
+            # ions added or deleted, so other processes sharing the database can update their tables
+            connection.execute("CREATE TABLE IF NOT EXISTS ion_changes(id INTEGER PRIMARY KEY AUTOINCREMENT, formula TEXT NOT NULL);")
+        with self.lock:  # read only connections are closed first, only a writer can remove the -wal and -shm files
+            self.connections.insert(0 if read_only else len(self.connections), connection)
+        return connection
+
+    def reader(self):  # read only connection for current thread (sqlite keeps its prepared statements)
+        if getattr(self.local, 'reader', None) is None:
+            self.local.reader = self.connect(True)
+        return self.local.reader
+
+    def writer(self):  # only used by writer thread (or on startup before bot is running)
+        if getattr(self.local, 'writer', None) is None:
+            self.local.writer = self.connect(False)
+        return self.local.writer
+
+    def fetchone(self, sql, parameters=()):
+        return self.reader().execute(sql, parameters).fetchone()
+
+    def fetchall(self, sql, parameters=()):
+        return self.reader().execute(sql, parameters).fetchall()
+
+    async def read(self, function, *args):  # run function that reads database in a reader thread
+        if self.read_executor is None:
+            self.read_executor = ThreadPoolExecutor(self.readers, thread_name_prefix='database-read')
+        with Timer('db'):
+            return await asyncio.get_running_loop().run_in_executor(self.read_executor, function, *args)
+
+    async def write(self, function, *args):  # run function that writes to database in writer thread
+        return await self.wait(self.submit_write(function, *args))
+
+    async def wait(self, future):  # wait for write that was already queued (i.e. by add_ion)
+        with Timer('db'):
+            return await asyncio.wrap_future(future)
+
+    def checkpoint(self):  # copy everything from the write-ahead log into the database file (synced to disk)
+        self.writer().execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+    def submit_write(self, function, *args):  # queue function for writer thread without waiting for it
+        if self.write_executor is None:
+            self.write_executor = ThreadPoolExecutor(1, thread_name_prefix='database-write')
+        return self.write_executor.submit(function, *args)
+
+    def close(self):  # waits for queued writes to finish, and for them to be saved to disk
+        if self.write_executor is not None:
+            self.submit_write(self.checkpoint)
+        for executor in (self.write_executor, self.read_executor):
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self.read_executor = self.write_executor = None
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections.clear()
+        self.local = threading.local()
+
+
+Data = Database(DATABASE)
+
+
+def create_indexes(connection):
+    # covering index so element lookups by symbol are answered from the index without reading the table
+    # (ions don't need one since formula is the primary key, which sqlite already indexes)
+    connection.execute('''CREATE INDEX IF NOT EXISTS elements_symbol ON elements(
+    symbol, name, atomic_number, charge, molar_mass, group_name, electronegativity, state);''')
+
+
 # add and delete from database
-def add_ion(name, formula, charge):
-    name = name.capitalize()
-    mass = molar_mass(formula)
-    if not mass:  # if molar_mass returned False (formula invalid)
-        return False
-    global CURSOR, CONNECTION
-    try:
-        CURSOR.execute('INSERT INTO ions VALUES(?, ?, ?, ?) ;', [name, formula, charge, mass])
-        CONNECTION.commit()
-        return 'Success'
-    except sqlite3.IntegrityError:  # primary key (formula) not unique
-        return 'Duplicate'
+class IonWriter:
+    # ions added and deleted are queued and saved by the writer thread, everything waiting is saved in one
+    # transaction (a class importing its ion list is one commit instead of one for each ion)
+    def __init__(self):
+        self.pending = []  # (operation, arguments, future)
+        self.lock = threading.Lock()  # ions are queued from the event loop and taken by the writer thread
+        self.scheduled = False  # save is already waiting in writer thread
+
+    def submit(self, operation, *args):
+        future = Future()
+        with self.lock:
+            self.pending.append((operation, args, future))
+            if not self.scheduled:
+                self.scheduled = True
+                Data.submit_write(self.save)
+        return future
+
+    def save(self):  # writer thread
+        with self.lock:
+            batch, self.pending = self.pending, []
+            self.scheduled = False
+        try:
+            results = save_ions([(operation, args) for operation, args, future in batch])
+        except Exception as error:  # nothing was saved
+            for operation, args, future in batch:
+                future.set_exception(error)
+        else:
+            for (operation, args, future), result in zip(batch, results):
+                future.set_result(result)
 
 
-def delete_ion(formula):
-    global CURSOR, CONNECTION
+IonWrites = IonWriter()
+
+
+def add_ion(name, formula, charge):  # future of 'Success', 'Duplicate', 'Invalid charge' or False (invalid formula)
+    return IonWrites.submit('add', name, formula, charge)
+
+
+def delete_ion(formula):  # future of whether ion was in database
     if formula == '*':  # not user function, just so I can reset database in case of mistakes
         print("Deleting and reloading databases")
-        CURSOR.execute('DROP TABLE elements;')
-        load_elements(PERIODIC_TABLE)
-        CURSOR.execute('DROP TABLE ions;')
-        load_ions(POLYATOMIC_IONS)
+        return Data.submit_write(reload_database)  # still after anything queued before it
+    return IonWrites.submit('delete', formula)
+
+
+def save_ions(changes):  # [(operation, arguments)] in the order they were made, returns result of each (writer thread)
+    connection = Data.writer()
+    formulas = list({args[1] if operation == 'add' else args[0] for operation, args in changes})
+    existing = {row[0] for row in connection.execute(  # duplicates are found before inserting anything
+        f"SELECT formula FROM ions WHERE formula IN ({', '.join('?' * len(formulas))}) ;", formulas)}
+    added = list({args[1] for operation, args in changes if operation == 'add'})
+    masses = dict(zip(added, bulk_molar_mass(added)))  # all at once, None if formula is invalid
+    results = []
+    changed = []
+    own = []  # ids of rows added to ion_changes
+    try:
+        for operation, args in changes:
+            if operation == 'add':
+                name, formula, charge = args
+                if masses[formula] is None:
+                    results.append(False)
+                elif first_charge(charge) is None:
+                    results.append('Invalid charge')
+                elif formula in existing:
+                    results.append('Duplicate')
+                else:
+                    connection.execute('INSERT INTO ions VALUES(?, ?, ?, ?) ;',
+                                       [name.capitalize(), formula, charge, masses[formula][0]])
+                    existing.add(formula)
+                    changed.append(formula)
+                    results.append('Success')
+            else:
+                formula = args[0]
+                results.append(formula in existing)
+                if formula in existing:
+                    connection.execute('DELETE FROM ions WHERE formula = ? ;', [formula])
+                    existing.discard(formula)
+                    changed.append(formula)
+        if ShareIonChanges:  # nothing else reads them otherwise
+            for formula in changed:
+                own.append(connection.execute('INSERT INTO ion_changes(formula) VALUES(?) ;', [formula]).lastrowid)
+            connection.execute('DELETE FROM ion_changes WHERE id <= (SELECT max(id) FROM ion_changes) - ? ;',
+                               [ION_CHANGES_KEPT])
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    OwnIonChanges.update(own)  # so sync_ion_changes doesn't apply them again
+    if changed:
+        update_ionic_table(changed)
+    return results
+
+
+def data_version():
+    # hash of table layout and both csv files, database is rebuilt when it doesn't match the one saved in it
+    digest = hashlib.sha256(f"schema {SCHEMA_VERSION}".encode())
+    for table in (PERIODIC_TABLE, POLYATOMIC_IONS):
+        digest.update(pathlib.Path(table).read_bytes())
+    return digest.hexdigest()
+
+
+def prepare_database():  # run on startup, rebuilds tables if they are missing or the csv files have changed
+    connection = Data.writer()
+    connection.execute("CREATE TABLE IF NOT EXISTS metadata(key TEXT PRIMARY KEY, value TEXT);")
+    version = data_version()
+    saved = connection.execute("SELECT value FROM metadata WHERE key = 'data_version';").fetchone()
+    if saved is None or saved[0] != version:
+        print("Reference data has changed, rebuilding database")
+        reload_database(version, keep_added_ions=True)
     else:
-        CURSOR.execute('DELETE FROM ions WHERE formula = ?;', [formula])
-        CONNECTION.commit()
-
-
-def load_elements(table):
-    file = open(table)
-    content = file.readlines()
-    file.close()
-    content.pop(0)  # delete table header
-    for i in range(len(content)):
-        content[i] = content[i].split(',')
-        content[i][-1] = content[i][-1][:-1]  # split each row into 2D array and remove new line (\n)
+        load_element_table()
+        create_indexes(connection)
+        connection.commit()
+        load_ionic_table()
+
+
+def reload_database(version=None, keep_added_ions=False):
+    # replace elements and ions tables from the csv files in one transaction
+    # (commands keep reading the old tables until everything is committed)
+    if version is None:
+        version = data_version()
+    elements = read_csv(PERIODIC_TABLE)
+    ions = read_csv(POLYATOMIC_IONS)
+    connection = Data.writer()
+
+    added = []  # ions users added with +data add
+    if keep_added_ions and connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'ions';").fetchone():
+        formulas = {row[1] for row in ions}
+        added = [row for row in connection.execute("SELECT name, formula, charge FROM ions;") if row[1] not in formulas]
+
+    connection.execute('BEGIN;')
+    try:
+        connection.execute('DROP TABLE IF EXISTS elements;')
+        connection.execute('DROP TABLE IF EXISTS ions;')
+        load_elements(elements, connection)
+        load_element_table(elements)  # ion masses need new element masses
+        load_ions(ions + added, connection)
+        create_indexes(connection)
+        connection.execute("INSERT OR REPLACE INTO metadata VALUES('data_version', ?);", [version])
+        if ShareIonChanges:
+            connection.execute("INSERT INTO ion_changes(formula) VALUES('*');")  # other processes reload everything
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        load_element_table()  # go back to table that is still in database
+        raise
+    load_ionic_table()
+
+
+def export_snapshot(path):  # write a compact copy of the prepared database (copied into containers as project.db)
+    # written next to it first, since the snapshot can replace the database that is open (bot.py --snapshot project.db)
+    prepare_database()
+    path = pathlib.Path(path)
+    temporary = pathlib.Path(f"{path}.tmp")
+    if temporary.exists():
+        temporary.unlink()
+    Data.writer().execute("VACUUM INTO ?;", [str(temporary)])
+    Data.close()  # nothing can have the database open when it is replaced (and its -wal and -shm files are removed)
+    os.replace(temporary, path)
+    print(f"Saved database snapshot to {path}")
+
+
+# element and ion tables shared between processes (shards.py)
+# file is a header, then for each table its records (offsets of key and value in file) in the table's order and the
+# keys again sorted with their record numbers (for binary search), then every key and value
+SHARED_HEADER = struct.Struct('<8s64sQ' + 'QI' * 3)  # magic, data version, last ion change, (offset, count) of tables
+SHARED_RECORD = struct.Struct('<IHIH')  # key offset, key length, value offset, value length
+SHARED_ORDER = struct.Struct('<IHI')  # key offset, key length, record number
+SHARED_MAGIC = b'CHEMDAT1'
+REMOVED = object()  # key deleted from a MappedTable
+
+Codec = namedtuple('Codec', ['encode_key', 'decode_key', 'encode_value', 'decode_value'])  # to and from bytes
+
+
+def encode_element(data):
+    # ElementData as atomic number, mass, electronegativity (NaN if None), number of charges, charges, then the text
+    electronegativity = data.electronegativity if data.electronegativity is not None else math.nan
+    numbers = struct.pack(f'<HddB{len(data.charges)}b', data.number, data.mass, electronegativity,
+                          len(data.charges), *data.charges)
+    return numbers + '\0'.join([data.name, data.symbol, data.charge, data.mass_text, data.group, data.state]).encode()
+
+
+def decode_element(value):
+    number, mass, electronegativity, count = struct.unpack_from('<HddB', value)
+    charges = struct.unpack_from(f'<{count}b', value, 19)
+    name, symbol, charge, mass_text, group, state = value[19 + count:].decode().split('\0')
+    return ElementData(name, symbol, number, charge, charges, mass, mass_text, group,
+                       None if math.isnan(electronegativity) else electronegativity, state)
+
+
+def encode_compound(compound):  # IonicCompound as mass (NaN if None), soluble, formula
+    mass = compound.mass if compound.mass is not None else math.nan
+    return struct.pack('<d?', mass, compound.soluble) + compound.formula.encode()
+
+
+def decode_compound(value):
+    mass, soluble = struct.unpack_from('<d?', value)
+    return IonicCompound(value[9:].decode(), soluble, None if math.isnan(mass) else mass)
+
+
+TEXT_KEY = (str.encode, bytes.decode)
+PAIR_KEY = (lambda pair: '\0'.join(pair).encode(), lambda key: tuple(key.decode().split('\0')))
+SHARED_TABLES = (  # in the order they are saved
+    Codec(*TEXT_KEY, encode_element, decode_element),  # ElementTable
+    Codec(*TEXT_KEY, lambda charge: struct.pack('<b', charge), lambda value: struct.unpack('<b', value)[0]),  # IonCharges
+    Codec(*PAIR_KEY, encode_compound, decode_compound),  # IonicTable
+)
+
+
+class MappedTable(Mapping):
+    # read only table inside a file mapped with mmap, so processes share one copy of it instead of each building their
+    # own. Keys are found with a binary search and values are decoded when they are read.
+    # changes (key -> value, or REMOVED) are kept in memory on top of the file, for ions added after it was written
+    def __init__(self, buffer, offset, count, codec, changes=None):
+        self.buffer = buffer
+        self.offset = offset  # of first record, sorted keys come after the records
+        self.count = count
+        self.codec = codec
+        self.changes = changes or {}
+        self.length = count
+        for key, value in self.changes.items():
+            if self.find(key) is None:
+                self.length += value is not REMOVED
+            else:
+                self.length -= value is REMOVED
+
+    def record(self, i):
+        return SHARED_RECORD.unpack_from(self.buffer, self.offset + i * SHARED_RECORD.size)
+
+    def find(self, key):  # record number of key in file, or None
+        key = self.codec.encode_key(key)
+        order = self.offset + self.count * SHARED_RECORD.size
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, i = SHARED_ORDER.unpack_from(self.buffer, order + middle * SHARED_ORDER.size)
+            found = self.buffer[key_offset:key_offset + key_length]
+            if found == key:
+                return i
+            elif found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def value(self, i):
+        key_offset, key_length, value_offset, value_length = self.record(i)
+        return self.codec.decode_value(self.buffer[value_offset:value_offset + value_length])
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            value = self.changes[key]
+        else:
+            i = self.find(key)
+            value = self.value(i) if i is not None else REMOVED
+        if value is REMOVED:
+            raise KeyError(key)
+        return value
+
+    def items(self):  # (key, value) in the order the table was saved, then ones added since (without searching)
+        for i in range(self.count):
+            key_offset, key_length, value_offset, value_length = self.record(i)
+            key = self.codec.decode_key(self.buffer[key_offset:key_offset + key_length])
+            if key in self.changes:
+                value = self.changes[key]
+            else:
+                value = self.codec.decode_value(self.buffer[value_offset:value_offset + value_length])
+            if value is not REMOVED:
+                yield key, value
+        for key, value in self.changes.items():
+            if value is not REMOVED and self.find(key) is None:
+                yield key, value
+
+    def __iter__(self):
+        return (key for key, value in self.items())
+
+    def __len__(self):
+        return self.length
+
+    def replace(self, removed, added):
+        changes = dict(self.changes)
+        changes.update(dict.fromkeys(removed, REMOVED))
+        changes.update(added)
+        return MappedTable(self.buffer, self.offset, self.count, self.codec, changes)
+
+
+def export_shared_data(path=SHARED_DATA):  # save element and ion tables for shards.py (after prepare_database)
+    global LastIonChange
+    connection = Data.writer()  # blank row the file starts from, so processes can tell if rows after it were pruned
+    LastIonChange = connection.execute("INSERT INTO ion_changes(formula) VALUES('');").lastrowid
+    connection.execute("DELETE FROM ion_changes WHERE id < ?;", [LastIonChange])  # older changes are in the file
+    connection.commit()
+    tables = [list(table.items()) for table in (ElementTable, IonCharges, IonicTable)]
+    start = SHARED_HEADER.size
+    directory = []  # (offset, count) of each table
+    for items in tables:
+        directory.append((start, len(items)))
+        start += len(items) * (SHARED_RECORD.size + SHARED_ORDER.size)
+    content = bytearray()  # keys and values, starting at start
+    records = []
+    for items, codec in zip(tables, SHARED_TABLES):
+        keys = []  # (key, offset, record number)
+        for i, (key, value) in enumerate(items):
+            key, value = codec.encode_key(key), codec.encode_value(value)
+            keys.append((key, start + len(content), i))
+            records.append(SHARED_RECORD.pack(start + len(content), len(key), start + len(content) + len(key), len(value)))
+            content += key + value
+        records.extend(SHARED_ORDER.pack(offset, len(key), i) for key, offset, i in sorted(keys))
+    header = SHARED_HEADER.pack(SHARED_MAGIC, data_version().encode(), LastIonChange,
+                                *(i for table in directory for i in table))
+    content = header + b''.join(records) + content
+    temporary = pathlib.Path(f"{path}.tmp")
+    temporary.write_bytes(content)
+    os.replace(temporary, path)  # processes already running keep their old mapping
+    print(f"Saved shared element and ion tables to {path} ({len(content)} bytes)")
+
+
+def map_shared_data(path=SHARED_DATA):  # use tables saved by export_shared_data, False if file is missing or old
+    global ElementTable, IonTable, IonCharges, IonicTable, LastIonChange
+    try:
+        with open(path, 'rb') as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):  # ValueError for empty file
+        return False
+    magic, version, last_change, *directory = SHARED_HEADER.unpack_from(buffer)
+    if magic != SHARED_MAGIC or version.decode() != data_version():
+        buffer.close()
+        return False
+    elements, IonCharges, IonicTable = (
+        MappedTable(buffer, offset, count, codec)
+        for offset, count, codec in zip(directory[::2], directory[1::2], SHARED_TABLES)
+    )
+    ElementTable = MappingProxyType(dict(elements.items()))  # small, and read for every element of every formula
+    IonTable = MappingProxyType(read_ion_table())  # user ions change, so they are read from the database
+    LastIonChange = last_change
+    return True
+
+
+def read_csv(table):  # rows of csv file without header (periodic table starts with byte order mark)
+    with open(table, newline='', encoding='utf-8-sig') as file:
+        content = [row for row in csv.reader(file) if row]
+    return content[1:]
+
+
+def load_elements(content, connection):
     print("Initializing element database")
-    CURSOR.execute(''' CREATE TABLE elements(
+    connection.execute(''' CREATE TABLE elements(
     name TEXT NOT NULL, symbol TEXT NOT NULL, atomic_number INTEGER PRIMARY KEY, charge TEXT,
     molar_mass TEXT NOT NULL, group_name TEXT NOT NULL, electronegativity REAL, state TEXT NOT NULL);''')
     # while all molar masses are REAL values, they are stored as strings to keep significant figures when viewing
 
     # filling table
-    for i in range(len(content)):
-        CURSOR.execute('INSERT INTO elements VALUES(?, ?, ?, ?, ?, ?, ?, ?)  ;', content[i])
-    CONNECTION.commit()
+    connection.executemany('INSERT INTO elements VALUES(?, ?, ?, ?, ?, ?, ?, ?)  ;', content)
     print("Finished loading periodic table")
 
 
-def load_ions(table):  # almost the same code as above
-    file = open(table)
-    content = file.readlines()
-    content.pop(0)
-    for i in range(len(content)):
-        content[i] = content[i].split(',')
-        content[i][-1] = content[i][-1][:-1]
-        content[i][3] = molar_mass(content[i][1])
+def load_ions(content, connection):  # almost the same code as above
+    rows = [list(row[:4]) + [''] * (4 - len(row)) for row in content]
+    blank = [row for row in rows if not row[3]]  # blank molar masses are calculated (all at once)
+    for row, result in zip(blank, bulk_molar_mass([row[1] for row in blank])):
+        row[3] = result[0] if result is not None else False
     print("Initializing ion database")
-    CURSOR.execute('''
+    connection.execute('''
         CREATE TABLE 
             ions(name TEXT NOT NULL, formula PRIMARY KEY, charge INTEGER NOT NULL, molar_mass TEXT NOT NULL);''')
 
     # filling table
-    for i in range(len(content)):
-        CURSOR.execute('INSERT INTO ions VALUES(?, ?, ?, ?)  ;', content[i])
-    CONNECTION.commit()
+    connection.executemany('INSERT OR IGNORE INTO ions VALUES(?, ?, ?, ?)  ;', rows)
     print("Finished loading polyatomic ions")
 
 
-def molar_mass(formula):
-    global CURSOR
-    total = 0
-    i = 0
-    while i < len(formula):  # each letter can be upper case, lower case or a number
-        coeff = None
-        element = None
+def element_data(row):  # ElementData from row of elements table
+    name, symbol, number, charge, mass, group, electronegativity, state = row
+    electronegativity = float(electronegativity) if electronegativity not in ('', None) else None
+    # masses like (98) are in brackets
+    return ElementData(name, symbol, int(number), charge, parse_charges(charge), float(mass.strip('()')), mass, group,
+                       electronegativity, state)
 
-        if formula[i] == '(':
-            # calculates the molar mass of formula inside brackets with this function (recursive)
-            # then multiplies it by the coefficient at the end
-            j = i + 1
-            while formula[j] != ')':
-                j += 1
-            mass = float(molar_mass(formula[i + 1:j]))
-            k = j + 1
-            while formula[k].isnumeric():
-                if k + 1 < len(formula):
-                    k += 1
-                else:
-                    k += 1
-                    break
-            coeff = int(formula[j + 1:k])
-            total += mass * coeff
-            i = k - 1  # since we need to skip brackets, can't use for loop for i
-
-        elif formula[i].isupper():  # the letter is capital (start of new element)
-            try:  # we don't know if there are any more letters in the string
-                if formula[i + 1].islower():  # the letter after is lowercase (two letter elements)
-                    element = formula[i:(i + 2)]
-                    try:
-                        if formula[i + 2].isnumeric():  # check if next number is coefficient
-                            j = i + 2
-                            while formula[j].isnumeric():
-                                # check how many consecutive digits there are
-                                if j + 1 < len(formula):
-                                    j = j + 1
-                                else:
-                                    j = j + 1
-                                    break
-                            coeff = int(formula[i + 2:j])
-                    except IndexError:
-                        pass
-                elif formula[i + 1].isnumeric():  # same thing as before just if the element is only one letter long
-                    j = i + 1
-                    while formula[j].isnumeric():
-                        if j + 1 < len(formula):
-                            j = j + 1
-                        else:
-                            j = j + 1
-                            break
-                    coeff = int(formula[i + 1:j])
-                    element = formula[i]
-                elif formula[i + 1].isupper():  # next element, no coefficient
-                    element = formula[i]
-            except IndexError:
-                element = formula[i]
-
-            if coeff is None:
-                coeff = 1
-
-            # search element database for mass
-            mass = CURSOR.execute("SELECT molar_mass FROM elements WHERE symbol = ?", [element]).fetchone()
-            if mass is None:
-                return False  # return that the formula is invalid
-            mass = mass[0]
-            if mass.startswith('('):  # if mass is in brackets
-                mass = mass[1:-1]
-            total = total + (float(mass) * int(coeff))
-
-        i += 1
-
-    return round(total, 2)  # does not use significant digits
-
-# outputs  (mostly just formatting and creating embeds)
-
-def show_equation():   # display loaded equation
-    embed = discord.Embed(title="Loaded Equation:",
-                          description=''.join(LoadedEquation[0]),
-                          color=4905928)
-    molecule_list = ''
-    for i in range(len(EquationCoeff)):
-        molecule_list += f"{i+1}: {EquationCoeff[i][1]}\n"
-    embed.add_field(name="Molecules",
-                    value=molecule_list,
-                    inline=False)  # displays element name
-    return embed
 
+def parse_charges(text):  # '2+ 3+' becomes (2, 3), '3- 3+' becomes (-3, 3)
+    charges = []
+    for charge in text.split():
+        if charge.endswith('-'):
+            charges.append(-int(charge[:-1]))
+        else:
+            charges.append(int(charge.rstrip('+')))
+    return tuple(charges)
+
+
+def load_element_table(rows=None):
+    # read elements table once so formula code never has to query database or parse mass strings again
+    # rows are like the elements table (or periodic table csv), read from database if not given
+    global ElementTable
+    if rows is None:
+        rows = Data.fetchall("SELECT * FROM elements")
+    table = {}
+    for row in rows:
+        data = element_data(row)
+        table[data.symbol] = data
+    ElementTable = MappingProxyType(table)  # read only view so nothing else can modify the table
+    # worker processes have a copy of the old table, they are replaced on the event loop when the next job is sent
+    # (this can run in the writer thread, where the executor can't be touched)
+    Workers.outdated = True
+
+
+def mass_composition(formula):  # (element, grams of element in one mole) for each element, or None if invalid
+    try:
+        composition = parse_formula(formula)
+    except ValueError:
+        return None
+    masses = []
+    for element, count in composition:
+        data = ElementTable.get(element)  # search element table for mass
+        if data is None:
+            return None
+        masses.append((element, data.mass * count))
+    return masses
+
+
+def molar_mass(formula):  # full precision, round when displaying
+    masses = mass_composition(formula)
+    if masses is None:
+        return False  # return that the formula is invalid
+    return sum(mass for element, mass in masses)
+
+
+def bulk_molar_mass(formulas):
+    # molar mass and mass percent of every element for many formulas at once, using the sparse
+    # formula x element count rows from parse_formula (cached) against the element masses in ElementTable
+    # returns (molar mass, ((element, percent), ...)) for each formula in order, None if a formula is invalid
+    results = []
+    for formula in formulas:
+        masses = mass_composition(formula)
+        total = sum(mass for element, mass in masses) if masses is not None else 0
+        if not total:
+            results.append(None)
+            continue
+        results.append((total, tuple((element, mass / total * 100) for element, mass in masses)))
+    return results
+
+# outputs  (embeds are made in engine.py)
 
 def convert_subscript(text, direction=True):
     # convert tosubscript for numbers; true means convert to, false convert from
@@ -833,64 +1493,6 @@ def convert_subscript(text, direction=True):
         return ''.join(new_text)
 
 
-def read_element(search):  # search database for entry matching given symbol
-    global CURSOR
-    data = CURSOR.execute("SELECT * FROM elements WHERE symbol = ? ;", [search]).fetchone()
-    if data is not None:  # get data into list from tuple
-        result = []
-        for i in range(len(data)):
-            if data[i] == '':
-                result.append('N/A')
-            else:
-                result.append(data[i])
-        embed = discord.Embed(title=result[0],
-                              description=f'''
-    Symbol: {result[1]}
-    Atomic Number: {result[2]}
-    Ionic Charge: {result[3]}
-    Molar Mass: {result[4]}
-    Group: {result[5]}
-    Electronegativity: {result[6]}
-    State (SATP): {result[7]}
-    ''',
-                              color=4481855)
-        return embed
-    else:
-        return None
-
-
-def read_ion(search):  # similar code to read_element
-    global CURSOR
-    data = CURSOR.execute("SELECT * FROM ions WHERE formula = ? ;", [search]).fetchone()
-    if data is not None:
-        result = []
-        for i in range(len(data)):
-            if data[i] == '':
-                result.append('N/A')
-            else:
-                result.append(data[i])
-
-        result[1] = convert_subscript(result[1])  # converts coefficients to subscript
-
-        embed = discord.Embed(title=result[0],
-                              description=f'''
-    Formula: {result[1]}
-    Ionic Charge: {result[2]}
-    Molar Mass: {result[3]}
-    ''',
-                              color=4148027)
-        return embed
-    else:
-        return None
-
-
 if __name__ == "__main__":
-    TOKEN = ''  # replace string with string of your bot token
-    # Create your own bot from discord developer portal; im sure you'll figure out how
-    if not DATABASE_EXISTS:  # create tables
-        load_elements(PERIODIC_TABLE)
-        load_ions(POLYATOMIC_IONS)
-
-    Bot.run(TOKEN)
-    # starts main event loop
-    # script will create discord session to the bot matching the token
+    import bot  # discord is only imported when actually running the bot
+    bot.main()
@@ -0,0 +1,89 @@
+'''
+Runs the bot as several processes that each connect some of the shards, for when one process isn't enough
+usage: python shards.py --shards 8 --processes 4
+The database is prepared and the element and ion tables are saved to shared_data.bin once, then every process maps
+that file (read only) instead of building its own copy. Ions added with +data add are saved to the shared database
+and picked up by the other processes within a few seconds.
+Each process serves its metrics on the next port (9108, 9109, ...) and saves profiles to profiles/process-N
+'''
+# standard library
+import argparse
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import time
+
+import project
+from metrics import METRICS_PORT
+from profiling import PROFILE_DIR
+
+BOT_SCRIPT = pathlib.Path(__file__).with_name('bot.py')
+RESTART_DELAY = 5  # seconds between checking for (and restarting) processes that stopped
+STOP_TIMEOUT = 30  # seconds processes get to finish saving after ctrl+c
+# processes save and stop on ctrl+c (SIGINT), windows can only terminate them
+STOP_SIGNAL = signal.SIGTERM if os.name == 'nt' else signal.SIGINT
+
+
+def shard_ids(process, processes, shards):  # shards are dealt out in turn so every process gets a similar number
+    return list(range(process, shards, processes))
+
+
+def start(process, processes, shards):
+    environment = dict(
+        os.environ,
+        CHEMBOT_SHARD_IDS=','.join(str(i) for i in shard_ids(process, processes, shards)),
+        CHEMBOT_SHARD_COUNT=str(shards),
+        CHEMBOT_SHARED_DATA=project.SHARED_DATA,
+        CHEMBOT_PROFILE_DIR=str(pathlib.Path(PROFILE_DIR, f'process-{process}')),
+        CHEMBOT_METRICS_PORT=str(METRICS_PORT + process if METRICS_PORT else 0),  # ports can't be shared
+    )
+    print(f"Starting process {process} with shards {environment['CHEMBOT_SHARD_IDS']}")
+    return subprocess.Popen([sys.executable, str(BOT_SCRIPT)], env=environment)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several processes")
+    parser.add_argument('--shards', type=int, required=True, help="total number of shards")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help="processes to split shards between")
+    arguments = parser.parse_args()
+    processes = max(1, min(arguments.processes, arguments.shards))
+
+    project.prepare_database()  # only done once, so processes don't all rebuild the database at the same time
+    project.export_shared_data()
+    project.Data.close()
+
+    # SIGTERM (i.e. from docker or systemd) only goes to this process, it is turned into SystemExit so the ones it
+    # started are stopped below instead of staying connected to their shards
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    running = []
+    interrupted = False
+    try:
+        running.extend(start(i, processes, arguments.shards) for i in range(processes))
+        while True:
+            time.sleep(RESTART_DELAY)
+            for i, process in enumerate(running):
+                if process.poll() is not None:
+                    print(f"Process {i} stopped (exit code {process.returncode}), restarting")
+                    running[i] = start(i, processes, arguments.shards)
+    except KeyboardInterrupt:  # ctrl+c is sent to every process, so they are already stopping
+        interrupted = True
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # already stopping
+        stop(running, interrupted)
+
+
+def stop(running, interrupted):  # wait for processes to save and stop
+    if not interrupted:
+        for process in running:
+            process.send_signal(STOP_SIGNAL)
+    for process in running:
+        try:
+            process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+'''
+Tests for the formula parser, equation balancer and shared ion tables in project.py (discord isn't needed, and the
+database tests use their own database in a temporary folder)
+usage: python -m pytest
+'''
+# standard library
+import math
+import pathlib
+import sqlite3
+
+# required dependency | py -m pip install pytest
+import pytest
+
+import project
+from benchmark import EQUATIONS, equation_matrix, organic_combustion, sympy_coefficients
+
+IMPOSSIBLE = [
+    "H2O = H2O2",  # only answer is all zeros (also in the benchmark equations)
+    "H2O + O2 = H2",  # oxygen would need a negative amount
+    "NaCl = KBr",  # nothing in common
+]
+CORPUS = [equation for equation in EQUATIONS + organic_combustion() if equation not in IMPOSSIBLE]
+FOLDER = pathlib.Path(__file__).parent  # csv files are here
+ADDED_IONS = [('Testate', 'C7H5O2', '1-'), ('Glycolate', 'C2H3O3', '1-'), ('Lactate', 'C3H5O3', '1-')]
+
+
+@pytest.mark.parametrize('formula, expected', [
+    ('H2O', {'H': 2, 'O': 1}),
+    ('C12H22O11', {'C': 12, 'H': 22, 'O': 11}),  # multi-digit counts
+    ('2H2O', {'H': 2, 'O': 1}),  # coefficient in front is ignored
+    ('Ca3(PO4)2', {'Ca': 3, 'P': 2, 'O': 8}),
+    ('K4[Fe(CN)6]', {'K': 4, 'Fe': 1, 'C': 6, 'N': 6}),  # nested brackets
+    ('(CH3)3COH', {'C': 4, 'H': 10, 'O': 1}),  # element repeated inside and outside brackets
+    ('CuSO4·5H2O', {'Cu': 1, 'S': 1, 'O': 9, 'H': 10}),
+    ('CuSO4.5H2O', {'Cu': 1, 'S': 1, 'O': 9, 'H': 10}),
+    ('CuSO4*5H2O', {'Cu': 1, 'S': 1, 'O': 9, 'H': 10}),
+    ('Na2CO3·10H2O', {'Na': 2, 'C': 1, 'O': 13, 'H': 20}),
+])
+def test_parse_formula(formula, expected):
+    assert dict(project.parse_formula(formula)) == expected
+
+
+def test_parse_formula_keeps_order():  # elements come back in the order they first appear
+    assert [element for element, count in project.parse_formula('NaHCO3')] == ['Na', 'H', 'C', 'O']
+
+
+@pytest.mark.parametrize('formula', ['H2O)', 'Ca3(PO4', 'K4[Fe(CN)6', 'h2o', 'H2O!', '', '12'])
+def test_parse_formula_invalid(formula):
+    with pytest.raises(ValueError):
+        project.parse_formula(formula)
+
+
+@pytest.mark.parametrize('equation', CORPUS)
+def test_solve_coefficients(equation):  # smallest positive whole numbers that conserve every element
+    matrix = equation_matrix(equation)
+    coeff = project.solve_coefficients(matrix)
+    assert coeff is not None
+    assert all(i > 0 for i in coeff)
+    assert math.gcd(*coeff) == 1
+    for row in matrix:
+        assert sum(count * i for count, i in zip(row, coeff)) == 0
+
+
+def test_solve_equation():
+    assert project.solve_equation(['CH4', 'O2'], ['CO2', 'H2O']) == [1, 2, 1, 2]
+    assert project.solve_equation(['C8H18', 'O2'], ['CO2', 'H2O']) == [2, 25, 16, 18]
+    assert project.solve_equation(['Pb(NO3)2', 'KI'], ['PbI2', 'KNO3']) == [1, 2, 1, 2]
+
+
+def test_solve_coefficients_keeps_matrix():
+    matrix = equation_matrix("CH4 + O2 = CO2 + H2O")
+    copy = [row[:] for row in matrix]
+    project.solve_coefficients(matrix)
+    assert matrix == copy
+
+
+def test_underdetermined():  # two reactions in one (water and hydrogen peroxide)
+    with pytest.raises(project.UnderdeterminedEquation) as error:
+        project.solve_coefficients(equation_matrix("H2 + O2 = H2O + H2O2"))
+    assert error.value.solutions == 2
+
+
+@pytest.mark.parametrize('equation', IMPOSSIBLE)
+def test_impossible(equation):
+    assert project.solve_coefficients(equation_matrix(equation)) is None
+
+
+def test_same_as_sympy():  # the method used before solve_coefficients
+    pytest.importorskip('sympy')
+    for equation in CORPUS:
+        matrix = equation_matrix(equation)
+        assert project.solve_coefficients(matrix) == sympy_coefficients(matrix)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):  # prepared database in a temporary folder, module globals are put back after
+    for name in ('ElementTable', 'IonTable', 'IonCharges', 'IonicTable', 'LastIonChange', 'ShareIonChanges'):
+        monkeypatch.setattr(project, name, getattr(project, name))
+    monkeypatch.setattr(project, 'OwnIonChanges', set())
+    monkeypatch.setattr(project, 'PERIODIC_TABLE', str(FOLDER / project.PERIODIC_TABLE))
+    monkeypatch.setattr(project, 'POLYATOMIC_IONS', str(FOLDER / project.POLYATOMIC_IONS))
+    monkeypatch.setattr(project, 'ION_CHANGES_KEPT', 2)
+    data = project.Database(str(tmp_path / 'project.db'))
+    monkeypatch.setattr(project, 'Data', data)
+    project.prepare_database()
+    project.ShareIonChanges = True  # like a process started by shards.py
+    yield tmp_path
+    data.close()
+
+
+def add_ions(ions):
+    assert project.save_ions([('add', ion) for ion in ions]) == ['Success'] * len(ions)
+
+
+def test_mapped_table(database):  # tables read back from the file are the same as the ones saved
+    charges, compounds = dict(project.IonCharges), dict(project.IonicTable)
+    project.export_shared_data(database / 'shared.bin')
+    assert project.map_shared_data(database / 'shared.bin')
+    for table, saved in ((project.IonCharges, charges), (project.IonicTable, compounds)):
+        assert isinstance(table, project.MappedTable)
+        assert list(table.items()) == list(saved.items())  # same order
+        assert len(table) == len(saved)
+        assert all(table[key] == value for key, value in saved.items())  # found with binary search
+    assert 'Zz' not in project.IonCharges
+    with pytest.raises(KeyError):
+        project.IonicTable[('Na', 'Zz')]
+
+    table = project.IonCharges.replace(['Na'], {'C7H5O2': -1, 'Cl': -2})
+    assert 'Na' not in table and table['C7H5O2'] == -1 and table['Cl'] == -2
+    assert len(table) == len(charges)  # one removed and one added
+    assert dict(table.items()) == {**{key: value for key, value in charges.items() if key != 'Na'},
+                                   'C7H5O2': -1, 'Cl': -2}
+    assert project.IonCharges['Na'] == charges['Na'] and 'C7H5O2' not in project.IonCharges  # original is unchanged
+
+
+def test_sync_own_and_other_changes(database):
+    project.export_shared_data(database / 'shared.bin')
+    add_ions(ADDED_IONS[:1])
+    assert project.sync_ion_changes() == []  # already applied when it was saved
+    other = sqlite3.connect(database / 'project.db')  # another process adds an ion
+    other.execute("INSERT INTO ions VALUES(?, ?, ?, ?);", ['Glycolate', 'C2H3O3', '1-', 75.04])
+    other.execute("INSERT INTO ion_changes(formula) VALUES('C2H3O3');")
+    other.commit()
+    other.close()
+    assert project.sync_ion_changes() == ['C2H3O3']
+    assert ('Na', 'C2H3O3') in project.IonicTable
+    assert project.sync_ion_changes() == []
+
+
+def test_sync_after_changes_were_pruned(database):  # shard restarted from an old file, after ION_CHANGES_KEPT changes
+    project.export_shared_data(database / 'shared.bin')
+    for ion in ADDED_IONS:  # one at a time, so the row the file starts from is pruned
+        add_ions([ion])
+    project.OwnIonChanges.clear()
+    assert project.map_shared_data(database / 'shared.bin')
+    assert 'C7H5O2' not in project.IonCharges
+    assert project.sync_ion_changes() == ['*']
+    assert project.IonCharges['C7H5O2'] == -1 and ('Na', 'C7H5O2') in project.IonicTable
+    assert project.sync_ion_changes() == []
+
+
+def test_sync_from_no_changes_after_pruning(database):  # tables were made before any changes (LastIonChange is 0)
+    assert project.LastIonChange == 0
+    for ion in ADDED_IONS:
+        add_ions([ion])
+    project.LastIonChange = 0
+    project.OwnIonChanges.clear()
+    assert project.sync_ion_changes() == ['*']